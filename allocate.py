@@ -0,0 +1,168 @@
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+from seating import (
+    DATA_DIR, STATUS_AVAILABLE, build_seat_registry, compile_seat_rules, explode_seats, generate_master_seat_map,
+    load_event, load_seat_rules, read_export, seat_ids, seat_status, tag_bookings,
+)
+
+# Proposed assignments are written here unless --out is given; review it before importing the seats
+PROPOSAL_FILE = 'proposed_seats.csv'
+PROPOSAL_COLUMNS = ['Confirmation', 'Source', 'First Name', 'Last Name', 'Ticket Count', 'Days', 'Seats', 'Gallery',
+                    'Row', 'Status']
+
+def day_free_seats(event, registry, seats, rules):
+    # Per day, seats that are neither booked nor blocked, as a boolean array indexed by seat id
+    layout = registry['layout']
+    free = {}
+    for day in event['days']:
+        allocated = seats.loc[(seats['date'] == day) & (seats['seat'] != ''), 'seat']
+        ids = seat_ids(registry, allocated)
+        occupied = np.bincount(ids[ids >= 0], minlength=registry['size']) > 0
+        status = seat_status(compile_seat_rules(rules, layout, day), layout, occupied, rules['colors'])['status']
+        free[day] = status.to_numpy() == STATUS_AVAILABLE
+    return free
+
+def seat_segments(registry):
+    # (gallery, row, seat ids in seating order) for every section of every row; a party never crosses an aisle
+    row_gallery = registry['layout'].drop_duplicates('row').set_index('row')['gallery']
+    return [(row_gallery[row_label], row_label, ids)
+            for row_label, *sections in registry['display_rows'] for ids in sections if len(ids)]
+
+def free_runs(free):
+    # (start, length) of each run of True in a boolean array
+    edges = np.diff(np.concatenate([[0], free.astype(np.int8), [0]]))
+    starts, stops = np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+    return list(zip(starts.tolist(), (stops - starts).tolist()))
+
+def build_free_index(segments, free, galleries):
+    # Free seat ranges per segment, plus one max-tree per gallery over its segments (front rows first),
+    # so the first segment with a long enough range is found in O(log rows)
+    index = {'segments': segments, 'runs': [free_runs(free[ids]) for _, _, ids in segments], 'trees': {}}
+    for gallery in galleries:
+        members = [i for i, (g, _, _) in enumerate(segments) if g == gallery]
+        size = 1
+        while size < max(len(members), 1):
+            size *= 2
+        tree = [0] * (2 * size)
+        for leaf, segment in enumerate(members):
+            tree[size + leaf] = max((length for _, length in index['runs'][segment]), default=0)
+        for node in range(size - 1, 0, -1):
+            tree[node] = max(tree[2 * node], tree[2 * node + 1])
+        index['trees'][gallery] = {'size': size, 'tree': tree, 'members': members}
+    return index
+
+def first_fit(gallery_tree, count):
+    # Leaf of the front-most segment with a free range of at least count seats, or None
+    tree, size = gallery_tree['tree'], gallery_tree['size']
+    if tree[1] < count:
+        return None
+    node = 1
+    while node < size:
+        node = 2 * node if tree[2 * node] >= count else 2 * node + 1
+    return node - size
+
+def update_leaf(gallery_tree, leaf, value):
+    tree, node = gallery_tree['tree'], gallery_tree['size'] + leaf
+    tree[node] = value
+    node //= 2
+    while node:
+        tree[node] = max(tree[2 * node], tree[2 * node + 1])
+        node //= 2
+
+def allocate_party(index, count, gallery_order):
+    # Adjacent free seat ids for a party of count in the first gallery (in preference order) that can seat
+    # it together, front rows first; the seats are taken out of the index. None when nobody has the room.
+    for gallery in gallery_order:
+        gallery_tree = index['trees'].get(gallery)
+        leaf = first_fit(gallery_tree, count) if gallery_tree else None
+        if leaf is None:
+            continue
+        segment = gallery_tree['members'][leaf]
+        runs = index['runs'][segment]
+        position = next(i for i, (_, length) in enumerate(runs) if length >= count)
+        start, length = runs[position]
+        if length == count:
+            del runs[position]
+        else:
+            runs[position] = (start + count, length - count)
+        update_leaf(gallery_tree, leaf, max((length for _, length in runs), default=0))
+        return index['segments'][segment][2][start:start + count]
+    return None
+
+def unallocated_parties(event):
+    # One party per booking without seats, with every day it needs a seat on
+    parties = []
+    for key, source in event['sources'].items():
+        df = read_export(source['path'])
+        seats = df['Seats'].fillna('').astype(str).str.strip()
+        df = df[(seats == '') | (seats.str.lower() == 'nan')]
+        counts = pd.to_numeric(df['Ticket Count'], errors='coerce').fillna(1).clip(lower=1).astype(int)
+        for row, count in zip(df.to_dict('records'), counts):
+            parties.append({
+                'Confirmation': row['Confirmation'],
+                'Source': os.path.basename(source['path']),
+                'First Name': row['First Name'],
+                'Last Name': row['Last Name'],
+                'Ticket Count': count,
+                'days': tuple(source['days']),
+            })
+    return parties
+
+def allocate_parties(event, parties, gallery_order=None, seats=None, registry=None, rules=None):
+    # Batch mode. Parties that need the same days share one free-seat index; parties needing more days go
+    # first (they need a seat free on all of them), larger parties before smaller ones within a day set.
+    if registry is None:
+        registry = build_seat_registry(generate_master_seat_map(event['seat_map']), event['galleries'])
+    if seats is None:
+        seats = pd.concat([explode_seats(tag_bookings(event, key, read_export(source['path'])))
+                           for key, source in event['sources'].items()], ignore_index=True)
+    if rules is None:
+        rules = load_seat_rules(event['rules'])
+    gallery_order = list(gallery_order or event['galleries'])
+    free = day_free_seats(event, registry, seats, rules)
+    segments = seat_segments(registry)
+    labels = registry['layout']['seat'].to_numpy()
+    row_of = registry['layout']['row'].to_numpy()
+    gallery_of = registry['layout']['gallery'].to_numpy()
+    proposals = []
+    by_days = {}
+    for party in parties:
+        by_days.setdefault(party['days'], []).append(party)
+    for days in sorted(by_days, key=len, reverse=True):
+        index = build_free_index(segments, np.logical_and.reduce([free[day] for day in days]), gallery_order)
+        for party in sorted(by_days[days], key=lambda p: -p['Ticket Count']):
+            ids = allocate_party(index, party['Ticket Count'], gallery_order)
+            proposal = {k: v for k, v in party.items() if k != 'days'}
+            proposal['Days'] = ', '.join(days)
+            if ids is None:
+                proposals.append(dict(proposal, Seats='', Gallery='', Row='', Status='no adjacent seats'))
+                continue
+            for day in days:
+                free[day][ids] = False
+            proposals.append(dict(proposal, Seats=', '.join(labels[ids]), Gallery=gallery_of[ids[0]],
+                                  Row=row_of[ids[0]], Status='proposed'))
+    return pd.DataFrame(proposals, columns=PROPOSAL_COLUMNS)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Propose adjacent seats for bookings that have none.')
+    parser.add_argument('event_dir', nargs='?', default=DATA_DIR)
+    parser.add_argument('--out', default=PROPOSAL_FILE, help=f'proposal CSV to write (default: {PROPOSAL_FILE})')
+    parser.add_argument('--galleries', default=None,
+                        help='comma-separated gallery preference order (default: the event\'s galleries, front first)')
+    args = parser.parse_args(argv)
+    event = load_event(args.event_dir)
+    order = [g.strip() for g in args.galleries.split(',')] if args.galleries else None
+    unknown = set(order or []) - set(event['galleries'])
+    if unknown:
+        parser.error(f"unknown galleries {sorted(unknown)}; expected some of {list(event['galleries'])}")
+    proposals = allocate_parties(event, unallocated_parties(event), order)
+    proposals.to_csv(args.out, index=False)
+    placed = (proposals['Status'] == 'proposed').sum()
+    print(f"{event['name']}: {placed} of {len(proposals)} unallocated bookings placed; proposal written to {args.out}")
+
+if __name__ == '__main__':
+    main()
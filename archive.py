@@ -0,0 +1,292 @@
+import argparse
+import json
+import sqlite3
+import time
+from contextlib import closing
+
+import numpy as np
+import pandas as pd
+
+from report import event_input_hashes
+from revenue import CUBE_KEYS, CUBE_VALUES, merge_cubes, money_values, revenue_cube, revenue_rollups
+from seating import (
+    STATUS_BLOCKED, STATUS_BOOKED, aggregate_day, aggregate_days, build_seat_registry, combine_seat_table,
+    day_seat_status, email_keys, explode_seats, generate_master_seat_map, load_bookings, load_event,
+    load_seat_rules, normalize_name, resolve_patrons, seat_ids, seat_map_layout,
+)
+from snapshot import build_snapshot
+from timing import stage
+
+# Local database holding every ingested event; `python archive.py ingest <event dirs>` fills it
+ARCHIVE_DB = 'events.sqlite'
+# Dates are ISO strings, so year and date range filters are plain string comparisons on the date indexes
+ARCHIVE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    title TEXT,
+    first_day TEXT,
+    last_day TEXT,
+    event TEXT NOT NULL,
+    rules TEXT NOT NULL,
+    inputs TEXT NOT NULL,
+    ingested_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS seats (
+    event_id INTEGER NOT NULL,
+    seat_id INTEGER NOT NULL,
+    seat TEXT NOT NULL,
+    row TEXT NOT NULL,
+    number INTEGER NOT NULL,
+    section TEXT NOT NULL,
+    gallery TEXT,
+    PRIMARY KEY (event_id, seat_id)
+);
+CREATE TABLE IF NOT EXISTS bookings (
+    event_id INTEGER NOT NULL,
+    source TEXT NOT NULL,
+    date TEXT NOT NULL,
+    confirmation TEXT,
+    name TEXT,
+    key TEXT,
+    patron TEXT,
+    email TEXT,
+    email_key TEXT,
+    phone TEXT,
+    seats TEXT,
+    ticket_count TEXT,
+    ticket TEXT,
+    coupon TEXT,
+    total REAL,
+    buyer_paid REAL,
+    discount REAL
+);
+CREATE TABLE IF NOT EXISTS booking_seats (
+    event_id INTEGER NOT NULL,
+    date TEXT NOT NULL,
+    seat TEXT NOT NULL,
+    seat_id INTEGER,
+    name TEXT,
+    key TEXT,
+    source TEXT NOT NULL,
+    confirmation TEXT
+);
+CREATE TABLE IF NOT EXISTS seat_status (
+    event_id INTEGER NOT NULL,
+    date TEXT NOT NULL,
+    seat_id INTEGER NOT NULL,
+    status INTEGER NOT NULL,
+    color TEXT,
+    names TEXT
+);
+CREATE TABLE IF NOT EXISTS patrons (
+    event_id INTEGER NOT NULL,
+    confirmation TEXT NOT NULL,
+    patron TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS revenue (
+    event_id INTEGER NOT NULL,
+    date TEXT, pass TEXT, ticket TEXT, coupon TEXT, gallery TEXT,
+    bookings REAL, seats REAL, total REAL, buyer_paid REAL, gateway_fee REAL, tugoz_fee REAL, income REAL,
+    discount REAL
+);
+CREATE INDEX IF NOT EXISTS bookings_confirmation ON bookings (confirmation);
+CREATE INDEX IF NOT EXISTS bookings_email ON bookings (email_key, date);
+CREATE INDEX IF NOT EXISTS bookings_key ON bookings (key);
+CREATE INDEX IF NOT EXISTS bookings_patron ON bookings (event_id, patron);
+CREATE INDEX IF NOT EXISTS bookings_date ON bookings (date);
+CREATE INDEX IF NOT EXISTS booking_seats_booking ON booking_seats (event_id, confirmation);
+CREATE INDEX IF NOT EXISTS booking_seats_seat ON booking_seats (seat, date);
+CREATE INDEX IF NOT EXISTS booking_seats_date ON booking_seats (event_id, date);
+CREATE INDEX IF NOT EXISTS seat_status_date ON seat_status (date, event_id, seat_id, status);
+CREATE INDEX IF NOT EXISTS patrons_event ON patrons (event_id, confirmation);
+CREATE INDEX IF NOT EXISTS revenue_event ON revenue (event_id);
+"""
+# Every table holding per-event rows; re-ingesting an event replaces all of them
+EVENT_TABLES = ['seats', 'bookings', 'booking_seats', 'seat_status', 'patrons', 'revenue']
+
+def connect(path=ARCHIVE_DB):
+    conn = sqlite3.connect(path)
+    conn.executescript(ARCHIVE_SCHEMA)
+    return conn
+
+def booking_rows(bookings, patrons):
+    # One row per booking per date, with the patron it was resolved to and a normalized email for lookups
+    column = lambda name: bookings[name].astype(object).where(bookings[name].notna(), None).to_numpy()
+    emails = email_keys(bookings['Email'])
+    return pd.DataFrame({
+        'source': bookings['__source'].to_numpy(),
+        'date': bookings['__date'].to_numpy(),
+        'confirmation': column('Confirmation'),
+        'name': bookings['__name'].to_numpy(),
+        'key': bookings['__key'].to_numpy(),
+        'patron': bookings['Confirmation'].map(patrons).fillna(bookings['__key']).to_numpy(),
+        'email': column('Email'),
+        'email_key': np.where(emails != '', emails, None),
+        'phone': column('Phone'),
+        'seats': column('Seats'),
+        'ticket_count': column('Ticket Count'),
+        'ticket': column('Short name'),
+        'coupon': column('Coupon Code'),
+        'total': money_values(bookings['Total']).to_numpy(),
+        'buyer_paid': money_values(bookings['Buyer Paid Total']).to_numpy(),
+        'discount': money_values(bookings['Discount']).to_numpy(),
+    })
+
+def ingest_event(conn, event_dir, force=False):
+    # Writes one event (bookings, seats per booking, venue map, per-day seat status, patrons and the revenue
+    # cube) in a single transaction, replacing what was stored for it. Unchanged inputs are skipped.
+    event = load_event(event_dir)
+    hashes = event_input_hashes(event)
+    stored = conn.execute('SELECT inputs FROM events WHERE name = ?', (event['name'],)).fetchone()
+    if not force and stored and json.loads(stored[0]) == hashes:
+        return event['name'], 'unchanged, skipped'
+    with stage('ingest_event', event=event['name']) as counters:
+        bookings = load_bookings(event)
+        seats = explode_seats(bookings)
+        patrons = resolve_patrons(bookings)
+        registry = build_seat_registry(generate_master_seat_map(event['seat_map']), event['galleries'])
+        rules = load_seat_rules(event['rules'])
+        day_aggs = aggregate_days(event, {day: seats[seats['date'] == day] for day in event['days']}, registry)
+        seat_index = combine_seat_table(event, day_aggs, registry, patrons)[4]
+        cube = merge_cubes([revenue_cube(event, key, bookings[bookings['__source'] == key], registry)
+                            for key in event['sources']])
+        ids = seat_ids(registry, seats['seat'])
+        with conn:
+            if stored:
+                event_id = conn.execute('SELECT id FROM events WHERE name = ?', (event['name'],)).fetchone()[0]
+                for table in EVENT_TABLES:
+                    conn.execute(f'DELETE FROM {table} WHERE event_id = ?', (event_id,))
+                conn.execute('DELETE FROM events WHERE id = ?', (event_id,))
+            days = sorted(event['days'])
+            event_id = conn.execute(
+                'INSERT INTO events (name, title, first_day, last_day, event, rules, inputs, ingested_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (event['name'], event['title'], days[0], days[-1], json.dumps(event), json.dumps(rules),
+                 json.dumps(hashes), time.time())).lastrowid
+            write = lambda table, df: df.assign(event_id=event_id).to_sql(table, conn, if_exists='append', index=False)
+            write('seats', registry['layout'][['seat', 'row', 'number', 'section', 'gallery']].rename_axis('seat_id')
+                  .reset_index())
+            write('bookings', booking_rows(bookings, patrons))
+            write('booking_seats', seats.assign(seat_id=np.where(ids >= 0, ids, None)))
+            # The day's own holder names (before any pass fill), so loading skips re-joining them
+            for day in event['days']:
+                status = day_seat_status(event, registry, seat_index, day, rules)
+                write('seat_status', pd.DataFrame({'date': day, 'seat_id': np.arange(registry['size']),
+                                                   'status': status['status'], 'color': status['color'],
+                                                   'names': day_aggs[day]['names']}))
+            write('patrons', patrons.rename_axis('confirmation').reset_index())
+            write('revenue', cube)
+        counters['rows'] = len(bookings)
+        counters['seats'] = len(seats)
+    return event['name'], f'{len(bookings)} bookings, {len(seats)} seats stored'
+
+def archived_events(conn):
+    # Event name -> version (its ingest time), newest events first
+    rows = conn.execute('SELECT name, ingested_at FROM events ORDER BY first_day DESC, name').fetchall()
+    return dict(rows)
+
+def load_archived(conn, name):
+    # Everything the dashboard needs for one archived event, without touching its CSVs. The venue map is
+    # rebuilt from the stored seats (row order, then center before side seats, as in the master seat map).
+    with stage('load_archived', event=name) as counters:
+        event_id, event, rules, version = conn.execute(
+            'SELECT id, event, rules, ingested_at FROM events WHERE name = ?', (name,)).fetchone()
+        event, rules = json.loads(event), json.loads(rules)
+        query = lambda sql: pd.read_sql_query(sql, conn, params=(event_id,))
+        venue = query('SELECT seat, row, section FROM seats WHERE event_id = ? ORDER BY seat_id')
+        seat_map = [{'row': row_label,
+                     'center': group.loc[group['section'] == 'center', 'seat'].tolist(),
+                     'side': group.loc[group['section'] != 'center', 'seat'].tolist()}
+                    for row_label, group in venue.groupby('row', sort=False)]
+        seats = query('SELECT date, seat, name, key, source, confirmation FROM booking_seats '
+                      'WHERE event_id = ? ORDER BY rowid')
+        patrons = query('SELECT confirmation, patron FROM patrons WHERE event_id = ?').set_index('confirmation')['patron']
+        names = query('SELECT date, names FROM seat_status WHERE event_id = ? ORDER BY date, seat_id')
+        cube = query(f"SELECT {', '.join(CUBE_KEYS + CUBE_VALUES)} FROM revenue WHERE event_id = ?")
+        counters['seats'] = len(seats)
+    return {
+        'event': event,
+        'rules': rules,
+        'version': ('archive', version),
+        'registry': build_seat_registry(seat_map, event['galleries']),
+        'day_seats': {day: seats[seats['date'] == day].reset_index(drop=True) for day in event['days']},
+        'names': {day: names.loc[names['date'] == day, 'names'].to_numpy(dtype=object) for day in event['days']},
+        'patrons': patrons,
+        'revenue': cube,
+    }
+
+def archived_snapshot(conn, name):
+    # Dashboard snapshot of an archived event; the per-day flags and the cross-day combine are recomputed
+    archived = load_archived(conn, name)
+    event, registry = archived['event'], archived['registry']
+    with stage('aggregate_days (archived names)', seats=registry['size'], days=len(event['days'])):
+        day_aggs = {day: aggregate_day(event, seats, day, registry, archived['names'][day])
+                    for day, seats in archived['day_seats'].items()}
+    with stage('combine_seat_table', seats=registry['size']):
+        table = combine_seat_table(event, day_aggs, registry, archived['patrons'])
+    return build_snapshot(event, archived['version'], table, archived['day_seats'], registry,
+                          seat_map_layout(registry), revenue_rollups(archived['revenue']), archived['rules'])
+
+def year_range(since=None, until=None):
+    return f'{since or 0:04d}-01-01', f'{until or 9999:04d}-12-31'
+
+def patron_seats(conn, email=None, name=None, since=None, until=None):
+    # Seats held by one patron across events, by email or by name. A name matches every booking resolved to
+    # the same patron within an event, so spelling variants seen in that event's exports are included.
+    if email:
+        match, params = 'b.email_key = ?', [email_keys(pd.Series([email]))[0]]
+    else:
+        match = 'b.key = ? OR (b.event_id, b.patron) IN (SELECT event_id, patron FROM bookings WHERE key = ?)'
+        params = [normalize_name(name)] * 2
+    return pd.read_sql_query(
+        'SELECT DISTINCT e.name AS event, s.date, s.seat, s.name, s.confirmation, s.source '
+        'FROM bookings b JOIN booking_seats s ON s.event_id = b.event_id AND s.confirmation = b.confirmation '
+        'AND s.date = b.date AND s.source = b.source JOIN events e ON e.id = b.event_id '
+        f"WHERE ({match}) AND b.date BETWEEN ? AND ? AND s.seat != '' ORDER BY s.date, s.seat",
+        conn, params=params + list(year_range(since, until)))
+
+def gallery_occupancy(conn, since=None, until=None):
+    # Booked share of bookable (not blocked) seat-days per gallery per year
+    occupancy = pd.read_sql_query(
+        'SELECT substr(st.date, 1, 4) AS year, s.gallery, COUNT(DISTINCT st.event_id) AS events, '
+        'COUNT(DISTINCT st.event_id || st.date) AS days, SUM(st.status = ?) AS booked, '
+        'SUM(st.status = ?) AS blocked, COUNT(*) AS seat_days '
+        'FROM seat_status st JOIN seats s ON s.event_id = st.event_id AND s.seat_id = st.seat_id '
+        'WHERE st.date BETWEEN ? AND ? GROUP BY year, s.gallery ORDER BY year, s.gallery',
+        conn, params=(STATUS_BOOKED, STATUS_BLOCKED) + year_range(since, until))
+    bookable = (occupancy['seat_days'] - occupancy['blocked']).replace(0, np.nan)
+    occupancy['occupancy'] = (occupancy['booked'] / bookable).round(3)
+    return occupancy
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Store events in a local SQLite archive and query across them.')
+    parser.add_argument('--db', default=ARCHIVE_DB, help=f'archive database (default: {ARCHIVE_DB})')
+    commands = parser.add_subparsers(dest='command', required=True)
+    ingest = commands.add_parser('ingest', help='store (or refresh) events from their event directories')
+    ingest.add_argument('event_dirs', nargs='+', help='directories holding an event.json manifest')
+    ingest.add_argument('--force', action='store_true', help='re-ingest events even if their inputs are unchanged')
+    patron = commands.add_parser('patron', help='seats a patron held across events')
+    who = patron.add_mutually_exclusive_group(required=True)
+    who.add_argument('--email')
+    who.add_argument('--name')
+    occupancy = commands.add_parser('occupancy', help='occupancy per gallery per year')
+    for command in (patron, occupancy):
+        command.add_argument('--since', type=int, default=None, help='first year (default: all)')
+        command.add_argument('--until', type=int, default=None, help='last year (default: all)')
+    args = parser.parse_args(argv)
+
+    with closing(connect(args.db)) as conn:
+        if args.command == 'ingest':
+            for event_dir in args.event_dirs:
+                name, outcome = ingest_event(conn, event_dir, args.force)
+                print(f'{name}: {outcome}')
+            return
+        if args.command == 'patron':
+            result = patron_seats(conn, args.email, args.name, args.since, args.until)
+        else:
+            result = gallery_occupancy(conn, args.since, args.until)
+    print(result.to_string(index=False) if len(result) else 'No matching rows.')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,467 @@
+import argparse
+import gc
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from revenue import merge_cubes, revenue_cube, revenue_rollups
+from seating import (
+    EVENT_MANIFEST, GALLERY_MAP, SNAPSHOT_DIR, build_seat_map_html, build_seat_registry, build_seat_table,
+    day_seat_status, explode_seats, generate_master_seat_list, generate_master_seat_map, load_bookings, load_event,
+    load_seat_rules, resolve_patrons, seat_map_day_payload, seat_map_layout, style_seat_table,
+)
+from snapshot import build_snapshot, current_snapshot, new_store
+from tickets import write_tickets
+
+# Column layout of a Tugoz booking export
+TUGOZ_COLUMNS = [
+    'Event Name', 'Date', 'Confirmation', 'Short name', 'First Name', 'Last Name', 'Email', 'Phone', 'Member Code',
+    'Related Member Code', 'Member Type', 'Confirmation Time (EDT)', 'Ticket Count', 'Other', 'Currency', 'Total',
+    'Credit Used', 'Buyer paid fee', 'Buyer Paid Total', 'Gateway fee', 'Tugoz fee', 'Estimated income', 'Seats',
+    'Coupon', 'Coupon Code', 'Discount', 'Status', 'Updated By', 'Payment Type', 'Transaction', 'Card', 'Referrer',
+    'Notes', 'Updated (EDT)', 'Checked in', 'Checkin Time', 'Checkin By', 'Survey Response', 'Address Street',
+    'Address City', 'Address State', 'Address Zip',
+]
+FIRST_NAMES = ['Asha', 'Ravi', 'Meera', 'Sunil', 'Priya', 'Anil', 'Kavita', 'Vijay', 'Neha', 'Rahul', 'Sneha', 'Amit']
+LAST_NAMES = ['Patel', 'Shah', 'Joshi', 'Kulkarni', 'Deshpande', 'Rao', 'Iyer', 'Mehta', 'Desai', 'Kapoor']
+SYNTHETIC_DAYS = ['2025-07-25', '2025-07-26', '2025-07-27']
+# Largest side seat number; centre seats are numbered from 101 as in the real venue
+MAX_SIDE_SEATS = 100
+
+BENCH_SIZES = [1000, 5000, 20000, 50000]
+BENCH_BASELINE = 'bench_baseline.json'
+# A stage regresses when it is this much slower (or hungrier) than the baseline, and by at least the
+# absolute margin, so timer noise on stages that take a few milliseconds is not a regression
+BENCH_TOLERANCE = 0.25
+BENCH_MIN_DELTA = {'seconds': 0.05, 'peak_mb': 1.0}
+LOAD_SESSIONS = 30
+
+# --- Synthetic event generator ---
+
+def row_labels(n):
+    # A..Z without I and O, then AA, BB, ..., then AAA, ... like the real venue
+    letters = [c for c in 'ABCDEFGHIJKLMNOPQRSTUVWXYZ' if c not in 'IO']
+    return [letters[i % len(letters)] * (i // len(letters) + 1) for i in range(n)]
+
+def generate_venue(n_seats, path):
+    # master_seat_map.csv with about sqrt(n/4) rows; each row has a centre block plus odd/even side seats
+    n_rows = max(8, round((n_seats / 4) ** 0.5))
+    per_row = [n_seats // n_rows + (1 if i < n_seats % n_rows else 0) for i in range(n_rows)]
+    labels = row_labels(n_rows)
+    rows = []
+    for label, count in zip(labels, per_row):
+        sides = min(MAX_SIDE_SEATS, 2 * round(count * 0.15))
+        center = count - sides
+        rows.append({
+            'Row': label,
+            'Center Start': 101,
+            'Center End': 100 + center,
+            'Sides Start': 1 if sides else 0,
+            'Sides End': sides,
+        })
+    pd.DataFrame(rows).to_csv(path, index=False)
+    return labels
+
+def typo(word):
+    # The third letter doubled: 'Patel' -> 'Pattel'. Sounds the same, and is a near match for longer words.
+    return word[:3] + word[2:3] + word[3:]
+
+def generate_bookings(rng, seat_labels, n_bookings, offset, double_rate, unallocated_share, event_name, day,
+                      returning_share=0.0, n_earlier=0):
+    # One export: 1-4 seats per booking taken in order from a shuffled seat list starting at offset.
+    # double_rate of bookings copy the seats of another booking in the same export, and wrapping past
+    # the end of the venue also double-books. returning_share of bookings are by one of the n_earlier
+    # patrons of earlier exports, entered differently, one variant each:
+    #   'Family' and a trailing space, upper-case email  -> same name key
+    #   first and last name swapped                      -> same name key
+    #   an honorific, same email                         -> name compared inside the email block
+    #   a typo, same phone but a new email               -> name compared inside the phone block
+    #   a typo, no email or phone (box office)           -> name compared inside a phonetic block
+    #   someone else of the household, same email/phone  -> compared, and kept apart
+    tickets = rng.integers(1, 5, n_bookings)
+    starts = offset + np.concatenate([[0], np.cumsum(tickets)[:-1]])
+    seats = np.array([', '.join(seat_labels[(s + np.arange(t)) % len(seat_labels)]) for s, t in zip(starts, tickets)],
+                     dtype=object)
+    if n_bookings:
+        doubled = np.flatnonzero(rng.random(n_bookings) < double_rate)
+        seats[doubled] = seats[rng.integers(0, n_bookings, len(doubled))]
+        seats[rng.random(n_bookings) < unallocated_share] = ''
+    total = tickets * rng.choice([25, 50, 99], n_bookings)
+    fee = np.round(total * 0.0535, 2)
+    serial = np.arange(n_bookings) + offset
+    first_names = np.array(FIRST_NAMES, dtype=object)[serial % len(FIRST_NAMES)]
+    last_names = np.array([f'{LAST_NAMES[i % len(LAST_NAMES)]} {i}' for i in serial], dtype=object)
+    emails = np.array([f'patron{i}@example.com' for i in serial], dtype=object)
+    phones = (15550000000 + serial).astype(object)
+    if n_bookings and n_earlier and returning_share:
+        returning = np.flatnonzero(rng.random(n_bookings) < returning_share)
+        for row, i, variant in zip(returning, rng.integers(0, n_earlier, len(returning)),
+                                   rng.integers(0, 6, len(returning))):
+            first, last = FIRST_NAMES[i % len(FIRST_NAMES)], LAST_NAMES[i % len(LAST_NAMES)]
+            email, phone = f'patron{i}@example.com', 15550000000 + i
+            if variant == 0:
+                first_names[row], last_names[row], email = f'{first} ', f'{last} {i} Family', email.title()
+            elif variant == 1:
+                first_names[row], last_names[row] = f'{last} {i}', first
+            elif variant == 2:
+                first_names[row], last_names[row] = f'Mrs {first}', f'{last} {i}'
+            elif variant == 3:
+                first_names[row], last_names[row], email = first, f'{typo(last)} {i}', emails[row]
+            elif variant == 4:
+                first_names[row], last_names[row], email, phone = first, f'{typo(last)} {i}', '', ''
+            else:
+                first_names[row], last_names[row] = FIRST_NAMES[(i + 1) % len(FIRST_NAMES)], f'{last} {i}'
+            emails[row], phones[row] = email, phone
+    df = pd.DataFrame({
+        'Event Name': event_name,
+        'Date': f'{day} 10:00:00',
+        'Confirmation': [f'T{offset:04X}{i:06X}' for i in range(n_bookings)],
+        'Short name': 'Synthetic',
+        'First Name': first_names,
+        'Last Name': last_names,
+        'Email': emails,
+        'Phone': phones,
+        'Confirmation Time (EDT)': '2025-07-20 12:00:00',
+        'Ticket Count': tickets,
+        'Other': tickets,
+        'Currency': 'USD',
+        'Total': total,
+        'Credit Used': 0,
+        'Buyer paid fee': fee,
+        'Buyer Paid Total': total + fee,
+        'Gateway fee': np.round(total * 0.029, 2),
+        'Tugoz fee': np.round(total * 0.02, 2),
+        'Estimated income': np.round(total * 0.951, 2),
+        'Seats': seats,
+        'Discount': 0,
+        'Status': 'Paid',
+        'Updated By': 'booking',
+        'Payment Type': 'Tugoz',
+        'Updated (EDT)': '2025-07-20 12:00:00',
+        'Checked in': 0,
+    })
+    return df.reindex(columns=TUGOZ_COLUMNS), int(offset + tickets.sum())
+
+def generate_event(out_dir, n_seats, n_bookings=None, double_rate=0.02, pass_share=0.2, unallocated_share=0.02,
+                   returning_share=0.1, seed=0):
+    # Writes a complete event directory (manifest, venue, rules, exports) that load_event can read.
+    # n_bookings defaults to filling about 90% of the venue on each pass day (2.5 seats per booking).
+    os.makedirs(out_dir, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    if n_bookings is None:
+        n_bookings = round(0.9 * n_seats / 2.5 / (pass_share + (1 - pass_share) / len(SYNTHETIC_DAYS)))
+    labels = generate_venue(n_seats, os.path.join(out_dir, 'master_seat_map.csv'))
+    seat_map = generate_master_seat_map(os.path.join(out_dir, 'master_seat_map.csv'))
+    seat_labels = np.array(generate_master_seat_list(seat_map), dtype=object)
+    rng.shuffle(seat_labels)
+
+    # Row labels are split into the four real galleries, front to back
+    quarter = -(-len(labels) // 4)
+    galleries = {gallery: labels[i * quarter:(i + 1) * quarter] for i, gallery in enumerate(GALLERY_MAP)}
+    rules = {
+        'colors': {'booked': '#4CAF50', 'available': '#fff'},
+        'block': [
+            {'rows': galleries['Balcony'][-2:], 'color': '#ffa500', 'override_booking': True},
+            {'row_range': [labels[0], labels[1]], 'color': '#ff4d4d'},
+            {'days': SYNTHETIC_DAYS[:1], 'rows': labels[2:4], 'section': 'right', 'color': '#ffa500'},
+        ],
+        'unblock': [],
+    }
+    with open(os.path.join(out_dir, 'seat_rules.json'), 'w', encoding='utf-8') as f:
+        json.dump(rules, f, indent=2)
+
+    name = f'Synthetic {n_seats} seats'
+    # Pass holders take the front of the shuffled seat list; each day's single-day buyers follow them
+    n_pass = round(n_bookings * pass_share)
+    n_day = (n_bookings - n_pass) // len(SYNTHETIC_DAYS)
+    sources = []
+    passes, offset = generate_bookings(rng, seat_labels, n_pass, 0, double_rate, unallocated_share, name,
+                                       SYNTHETIC_DAYS[1])
+    passes.to_csv(os.path.join(out_dir, 'pass.csv'), index=False)
+    for day in SYNTHETIC_DAYS:
+        df, _ = generate_bookings(rng, seat_labels, n_day, offset, double_rate, unallocated_share, name, day,
+                                  returning_share, n_pass)
+        df.to_csv(os.path.join(out_dir, f'{day}.csv'), index=False)
+        sources.append({'key': day[-2:], 'file': f'{day}.csv', 'pass': 'single-day', 'days': [day]})
+    sources.append({'key': 'pass', 'file': 'pass.csv', 'pass': 'multi-day', 'days': SYNTHETIC_DAYS[1:]})
+
+    manifest = {
+        'name': name,
+        'title': f'{name} - Seat Allocation Overview',
+        'venue': {'seat_map': 'master_seat_map.csv', 'rules': 'seat_rules.json', 'galleries': galleries},
+        'reference_day': SYNTHETIC_DAYS[0],
+        'days': [{'date': day, 'label': day} for day in SYNTHETIC_DAYS],
+        'sources': sources,
+    }
+    with open(os.path.join(out_dir, EVENT_MANIFEST), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    return out_dir
+
+# --- Harness ---
+
+def run_stages(event_dir):
+    # The app's pipeline, one stage at a time; yields (stage, rows or seats processed, callable)
+    event = load_event(event_dir)
+    state = {}
+
+    def load_cold():
+        shutil.rmtree(os.path.join(event_dir, SNAPSHOT_DIR), ignore_errors=True)
+        state['bookings'] = load_bookings(event)
+        state['seats'] = explode_seats(state['bookings'])
+        return len(state['seats'])
+
+    def load_snapshot():
+        state['bookings'] = load_bookings(event)
+        state['seats'] = explode_seats(state['bookings'])
+        return len(state['seats'])
+
+    def patrons():
+        state['patrons'] = resolve_patrons(state['bookings'])
+        return len(state['bookings'])
+
+    def registry():
+        state['registry'] = build_seat_registry(generate_master_seat_map(event['seat_map']), event['galleries'])
+        return state['registry']['size']
+
+    def seat_table():
+        state['table'] = build_seat_table(event, state['seats'], state['registry'], state['patrons'])
+        return len(state['table'][0])
+
+    def revenue():
+        bookings = state['bookings']
+        cube = merge_cubes([revenue_cube(event, key, bookings[bookings['__source'] == key], state['registry'])
+                            for key in event['sources']])
+        revenue_rollups(cube)
+        return len(bookings)
+
+    def style_first_page():
+        seat_df, styles = state['table'][0], state['table'][5]
+        style_seat_table(seat_df, styles, 0, 200).to_html()
+        return min(200, len(seat_df))
+
+    def style_full():
+        seat_df, styles = state['table'][0], state['table'][5]
+        style_seat_table(seat_df, styles).to_html()
+        return len(seat_df)
+
+    def seat_map_payload():
+        rules = load_seat_rules(event['rules'])
+        seat_index = state['table'][4]
+        # Serialised as Streamlit would send them to the component
+        json.dumps(seat_map_layout(state['registry']))
+        for day in event['days']:
+            status_df = day_seat_status(event, state['registry'], seat_index, day, rules)
+            json.dumps(seat_map_day_payload(seat_index, day, status_df))
+        return state['registry']['size'] * len(event['days'])
+
+    def seat_map_html():
+        rules = load_seat_rules(event['rules'])
+        seat_index = state['table'][4]
+        for day in event['days']:
+            status_df = day_seat_status(event, state['registry'], seat_index, day, rules)
+            build_seat_map_html(state['registry'], seat_index, day, status_df)
+        return state['registry']['size'] * len(event['days'])
+
+    def ticket_pdfs():
+        # Serial, so the peak memory covers the page streaming rather than a pool of workers
+        with tempfile.TemporaryDirectory() as out:
+            write_tickets(event_dir, out, workers=1)
+        return len(state['seats'])
+
+    return [
+        ('load_and_normalize (csv)', load_cold),
+        ('load_and_normalize (snapshot)', load_snapshot),
+        ('resolve_patrons', patrons),
+        ('build_seat_registry', registry),
+        ('build_seat_table', seat_table),
+        ('revenue_rollups', revenue),
+        ('style_seat_table (page)', style_first_page),
+        ('style_seat_table (full)', style_full),
+        ('seat_map_payload', seat_map_payload),
+        ('build_seat_map_html', seat_map_html),
+        ('ticket_pdfs', ticket_pdfs),
+    ]
+
+def measure(event_dir, repeat):
+    # Median wall time over `repeat` runs, then one extra run under tracemalloc for each stage's peak
+    # Python heap (NumPy/pandas buffers included, worker processes and Arrow's allocator are not)
+    results, times = {}, {}
+    for _ in range(repeat):
+        for stage, fn in run_stages(event_dir):
+            gc.collect()
+            start = time.perf_counter()
+            count = fn()
+            times.setdefault(stage, []).append(time.perf_counter() - start)
+            results[stage] = {'count': count}
+    for stage, elapsed in times.items():
+        results[stage]['seconds'] = statistics.median(elapsed)
+    for stage, fn in run_stages(event_dir):
+        gc.collect()
+        tracemalloc.start()
+        fn()
+        results[stage]['peak_mb'] = tracemalloc.get_traced_memory()[1] / 2 ** 20
+        tracemalloc.stop()
+    return results
+
+def compare(results, baseline, tolerance, min_delta=BENCH_MIN_DELTA):
+    # Stages (per venue size) whose median time or peak memory is over the baseline by more than both the
+    # relative tolerance and the metric's absolute margin
+    regressions = []
+    for size, stages in results.items():
+        for stage, current in stages.items():
+            base = baseline.get(size, {}).get(stage)
+            if base is None:
+                continue
+            for metric in ('seconds', 'peak_mb'):
+                delta = current[metric] - base[metric]
+                if delta > base[metric] * tolerance and delta > min_delta[metric]:
+                    regressions.append(f'{size} seats, {stage}: {metric} {base[metric]:.3f} -> {current[metric]:.3f}')
+    return regressions
+
+def print_results(results, baseline):
+    for size, stages in results.items():
+        print(f'\n{size} seats')
+        print(f"  {'stage':32} {'count':>9} {'seconds':>9} {'peak MB':>9} {'vs base':>8}")
+        for stage, r in stages.items():
+            base = baseline.get(size, {}).get(stage)
+            ratio = f"{r['seconds'] / base['seconds']:.2f}x" if base and base['seconds'] else ''
+            print(f"  {stage:32} {r['count']:>9} {r['seconds']:>9.4f} {r['peak_mb']:>9.1f} {ratio:>8}")
+
+# --- Concurrent sessions ---
+
+def input_version(event):
+    # What the app keys a snapshot on, from file stats (content hashes are cached per stat in the app)
+    paths = [source['path'] for source in event['sources'].values()] + [event['seat_map'], event['rules']]
+    return tuple((path, os.stat(path).st_size, os.stat(path).st_mtime_ns) for path in paths)
+
+def pipeline_snapshot(event, version):
+    # The whole seat model from the exports, as a session without a shared snapshot has to build it
+    bookings = load_bookings(event)
+    seats = explode_seats(bookings)
+    registry = build_seat_registry(generate_master_seat_map(event['seat_map']), event['galleries'])
+    table = build_seat_table(event, seats, registry, resolve_patrons(bookings))
+    day_seats = {day: seats[seats['date'] == day].reset_index(drop=True) for day in event['days']}
+    revenue = revenue_rollups(merge_cubes([revenue_cube(event, key, bookings[bookings['__source'] == key], registry)
+                                           for key in event['sources']]))
+    return build_snapshot(event, version, table, day_seats, registry, seat_map_layout(registry), revenue)
+
+def render_session(snapshot, day):
+    # What one dashboard rerun does with a snapshot: a styled table page, a seat map day and the rollups
+    seat_df, styles = snapshot['table'][0], snapshot['table'][5]
+    style_seat_table(seat_df, styles, 0, 200).to_html()
+    json.dumps(snapshot['days'][day]['payload'])
+    pd.DataFrame(snapshot['days'][day]['galleries']).to_json()
+    for table in snapshot['revenue'].values():
+        table.to_json()
+
+def load_test(event_dir, sessions, store=None):
+    # sessions dashboard reruns at once, one thread each like Streamlit. With a store they all read its
+    # snapshot, so the model is built at most once; without one every session builds its own. Returns wall
+    # time, per-session mean seconds waiting for the model and rendering, and how many models were built.
+    event = load_event(event_dir)
+    days = list(event['days'])
+    builds = []
+
+    def build(version):
+        builds.append(version)
+        return pipeline_snapshot(event, version)
+
+    def session(i):
+        start = time.perf_counter()
+        version = input_version(event)
+        snapshot = build(version) if store is None else current_snapshot(store, version, lambda: build(version))
+        ready = time.perf_counter()
+        render_session(snapshot, days[i % len(days)])
+        return ready - start, time.perf_counter() - ready
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=sessions) as pool:
+        timings = list(pool.map(session, range(sessions)))
+    wall = time.perf_counter() - start
+    return {
+        'wall': wall,
+        'model': sum(t[0] for t in timings) / sessions,
+        'render': sum(t[1] for t in timings) / sessions,
+        'builds': len(builds),
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Synthetic event generator and pipeline benchmark.')
+    sub = parser.add_subparsers(dest='command', required=True)
+    for name, help_text in [('generate', 'write a synthetic event directory'), ('run', 'benchmark each stage'),
+                            ('load', 'simulate concurrent dashboard sessions')]:
+        p = sub.add_parser(name, help=help_text)
+        p.add_argument('--bookings', type=int, default=None,
+                       help='bookings across all exports (default: about 90%% of the venue booked per day)')
+        p.add_argument('--double-rate', type=float, default=0.02,
+                       help="share of bookings that reuse another booking's seats")
+        p.add_argument('--pass-share', type=float, default=0.2, help='share of bookings on the multi-day pass export')
+        p.add_argument('--unallocated-share', type=float, default=0.02, help='share of bookings with no seat')
+        p.add_argument('--returning-share', type=float, default=0.1,
+                       help='share of single-day bookings by an earlier patron, entered under a name variant')
+        p.add_argument('--seed', type=int, default=0)
+    gen = sub.choices['generate']
+    gen.add_argument('out_dir')
+    gen.add_argument('--seats', type=int, default=5000)
+    run = sub.choices['run']
+    run.add_argument('--sizes', default=','.join(map(str, BENCH_SIZES)), help='comma-separated venue sizes in seats')
+    run.add_argument('--repeat', type=int, default=3, help='timed runs per stage; the median is kept')
+    run.add_argument('--baseline', default=BENCH_BASELINE, help=f'baseline JSON (default: {BENCH_BASELINE})')
+    run.add_argument('--save-baseline', action='store_true', help='store these results as the new baseline')
+    run.add_argument('--tolerance', type=float, default=BENCH_TOLERANCE, help='allowed slowdown before failing')
+    load = sub.choices['load']
+    load.add_argument('--seats', type=int, default=5000)
+    load.add_argument('--sessions', type=int, default=LOAD_SESSIONS, help='concurrent sessions')
+    args = parser.parse_args(argv)
+    options = dict(n_bookings=args.bookings, double_rate=args.double_rate, pass_share=args.pass_share,
+                   unallocated_share=args.unallocated_share, returning_share=args.returning_share, seed=args.seed)
+
+    if args.command == 'generate':
+        generate_event(args.out_dir, args.seats, **options)
+        print(f'Synthetic event written to {args.out_dir}')
+        return 0
+
+    if args.command == 'load':
+        with tempfile.TemporaryDirectory() as tmp:
+            event_dir = generate_event(os.path.join(tmp, 'event'), args.seats, **options)
+            load_bookings(load_event(event_dir))  # write the Arrow snapshots before the sessions race for them
+            print(f'{args.sessions} concurrent sessions, {args.seats} seats')
+            print(f"  {'mode':24} {'wall s':>8} {'model s':>8} {'render s':>9} {'builds':>7}")
+            shared = new_store()
+            for label, store in [('own pipeline per session', None), ('shared snapshot, cold', shared),
+                                 ('shared snapshot, warm', shared)]:
+                r = load_test(event_dir, args.sessions, store)
+                print(f"  {label:24} {r['wall']:>8.2f} {r['model']:>8.3f} {r['render']:>9.3f} {r['builds']:>7}")
+        return 0
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in [int(s) for s in args.sizes.split(',')]:
+            event_dir = generate_event(os.path.join(tmp, str(size)), size, **options)
+            results[str(size)] = measure(event_dir, args.repeat)
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+    print_results(results, baseline)
+    if args.save_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f'\nBaseline saved to {args.baseline}')
+        return 0
+    regressions = compare(results, baseline, args.tolerance)
+    for line in regressions:
+        print(f'REGRESSION {line}')
+    return 1 if regressions else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
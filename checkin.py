@@ -0,0 +1,242 @@
+import argparse
+import bisect
+import datetime
+import json
+import os
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from seating import DATA_DIR, load_bookings, load_event
+
+# Check-ins made at the door, one JSON object per line, next to the event's exports
+CHECKIN_LOG = 'checkins.jsonl'
+CHECKIN_PORT = 8765
+# The service has no authentication, so it only listens on this machine unless --host says otherwise
+CHECKIN_HOST = '127.0.0.1'
+# Most matches a name prefix search returns, by default and whatever ?limit= asks for
+NAME_SEARCH_LIMIT = 20
+NAME_SEARCH_MAX_LIMIT = 200
+
+def normalize_confirmation(value):
+    return value.strip().upper()
+
+def normalize_email(value):
+    return value.strip().lower()
+
+def normalize_phone(value):
+    # Digits only, without a leading US country code
+    digits = re.sub(r'\D', '', value)
+    return digits[1:] if len(digits) == 11 and digits.startswith('1') else digits
+
+def name_tokens(name):
+    return [t for t in re.split(r'[^a-z0-9]+', name.lower()) if t]
+
+def checkin_records(event):
+    # One record per booking per day: who, which seats, and the check-in state from the export
+    bookings = load_bookings(event)
+    records = []
+    for row in bookings.astype(object).where(bookings.notna(), None).to_dict('records'):
+        seats = row['Seats'] or ''
+        records.append({
+            'confirmation': row['Confirmation'] or '',
+            'date': row['__date'],
+            'name': row['__name'],
+            'email': row['Email'] or '',
+            'phone': row['Phone'] or '',
+            'seats': [s.strip() for s in seats.split(',') if s.strip()],
+            'source': row['__source'],
+            'checked_in': (row['Checked in'] or '0').strip() not in ('', '0'),
+            'checkin_time': row['Checkin Time'],
+            'station': None,
+        })
+    return records
+
+def build_checkin_index(event):
+    # Per day: exact-match dicts for confirmation, email and phone, and a sorted (name word, record) list
+    # for name prefixes. Every lookup is a dict hit or a bisect plus the matches.
+    records = checkin_records(event)
+    index = {'records': records, 'days': {}}
+    tokens = {}
+    for i, record in enumerate(records):
+        day = index['days'].setdefault(record['date'], {'confirmation': {}, 'email': {}, 'phone': {}})
+        for field, key in (('confirmation', normalize_confirmation(record['confirmation'])),
+                           ('email', normalize_email(record['email'])),
+                           ('phone', normalize_phone(record['phone']))):
+            if key:
+                day[field].setdefault(key, []).append(i)
+        tokens.setdefault(record['date'], []).extend((token, i) for token in set(name_tokens(record['name'])))
+    for date, day_tokens in tokens.items():
+        day_tokens.sort()
+        index['days'][date]['name_tokens'] = [t for t, _ in day_tokens]
+        index['days'][date]['name_records'] = [i for _, i in day_tokens]
+    return index
+
+def search_names(day_index, prefix, limit=NAME_SEARCH_LIMIT):
+    # Records with a name word starting with each word of the prefix ("pat" or "chan pat")
+    words = name_tokens(prefix)
+    if not words:
+        return []
+    matches = None
+    for word in words:
+        start = bisect.bisect_left(day_index['name_tokens'], word)
+        stop = bisect.bisect_left(day_index['name_tokens'], word + '\uffff')
+        found = set(day_index['name_records'][start:stop])
+        matches = found if matches is None else matches & found
+    return sorted(matches)[:limit]
+
+def lookup(index, day, confirmation=None, email=None, phone=None, name=None, limit=NAME_SEARCH_LIMIT):
+    day_index = index['days'].get(day)
+    if day_index is None:
+        return []
+    if confirmation:
+        ids = day_index['confirmation'].get(normalize_confirmation(confirmation), [])
+    elif email:
+        ids = day_index['email'].get(normalize_email(email), [])
+    elif phone:
+        ids = day_index['phone'].get(normalize_phone(phone), [])
+    elif name:
+        ids = search_names(day_index, name, limit)
+    else:
+        return []
+    return [index['records'][i] for i in ids[:limit]]
+
+def confirmation_records(index, day, confirmation):
+    # Every record of a confirmation on a day; one booking can be in more than one export for the same day
+    day_index = index['days'].get(day)
+    if day_index is None:
+        return []
+    return [index['records'][i] for i in day_index['confirmation'].get(normalize_confirmation(confirmation), [])]
+
+def load_checkin_log(index, path):
+    # Replays the append-only log over the check-in state that came from the exports
+    if not os.path.exists(path):
+        return 0
+    count = 0
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            records = confirmation_records(index, entry['date'], entry['confirmation'])
+            for record in records:
+                record.update(checked_in=entry['checked_in'], checkin_time=entry['time'], station=entry.get('station'))
+            count += bool(records)
+    return count
+
+def set_checked_in(index, lock, log_path, confirmation, day, checked_in=True, station=None):
+    # Updates every record of the booking on that day and appends the change to the log (flushed to disk
+    # before returning). Returns the updated records, empty when there is no such booking.
+    with lock:
+        records = confirmation_records(index, day, confirmation)
+        if not records:
+            return []
+        entry = {
+            'confirmation': records[0]['confirmation'],
+            'date': day,
+            'checked_in': checked_in,
+            'time': datetime.datetime.now().isoformat(timespec='seconds'),
+            'station': station,
+        }
+        with open(log_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(entry) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        for record in records:
+            record.update(checked_in=checked_in, checkin_time=entry['time'], station=station)
+        return records
+
+def make_handler(event, index, log_path):
+    lock = threading.Lock()
+    days = list(event['days'])
+
+    class CheckinHandler(BaseHTTPRequestHandler):
+        # GET /lookup?day=&confirmation=|email=|phone=|name=, POST /checkin {confirmation, day, station, undo}
+        protocol_version = 'HTTP/1.1'
+
+        def send_json(self, status, payload):
+            body = json.dumps(payload).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def selected_day(self, value):
+            # Defaults to today on event days
+            day = value or datetime.date.today().isoformat()
+            return day if day in days else None
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            params = {k: v[0] for k, v in parse_qs(url.query).items()}
+            if url.path == '/health':
+                return self.send_json(200, {'event': event['name'], 'days': days, 'records': len(index['records'])})
+            if url.path != '/lookup':
+                return self.send_json(404, {'error': 'not found'})
+            day = self.selected_day(params.get('day'))
+            if day is None:
+                return self.send_json(400, {'error': f'day must be one of {days}'})
+            try:
+                limit = int(params.get('limit', NAME_SEARCH_LIMIT))
+            except ValueError:
+                return self.send_json(400, {'error': 'limit must be a whole number'})
+            limit = min(max(limit, 1), NAME_SEARCH_MAX_LIMIT)
+            start = time.perf_counter()
+            records = lookup(index, day, params.get('confirmation'), params.get('email'), params.get('phone'),
+                             params.get('name'), limit)
+            micros = (time.perf_counter() - start) * 1e6
+            self.send_json(200, {'day': day, 'matches': records, 'lookup_us': round(micros, 1)})
+
+        def do_POST(self):
+            if urlparse(self.path).path != '/checkin':
+                return self.send_json(404, {'error': 'not found'})
+            try:
+                body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+            except ValueError:
+                return self.send_json(400, {'error': 'body must be JSON'})
+            if not isinstance(body, dict):
+                return self.send_json(400, {'error': 'body must be a JSON object'})
+            day = self.selected_day(body.get('day'))
+            if day is None or not isinstance(body.get('confirmation'), str) or not body['confirmation'].strip():
+                return self.send_json(400, {'error': f'confirmation and a day in {days} are required'})
+            records = set_checked_in(index, lock, log_path, body['confirmation'], day, not body.get('undo', False),
+                                     body.get('station'))
+            if not records:
+                return self.send_json(404, {'error': f"no booking {body['confirmation']} on {day}"})
+            self.send_json(200, {'day': day, 'matches': records})
+
+        def log_message(self, format, *args):
+            pass  # one line per scan would drown the console
+
+    return CheckinHandler
+
+def serve(event_dir, host=CHECKIN_HOST, port=CHECKIN_PORT):
+    event = load_event(event_dir)
+    index = build_checkin_index(event)
+    log_path = os.path.join(event_dir, CHECKIN_LOG)
+    replayed = load_checkin_log(index, log_path)
+    server = ThreadingHTTPServer((host, port), make_handler(event, index, log_path))
+    print(f"Check-in lookup for {event['name']}: {len(index['records'])} bookings, {replayed} logged check-ins "
+          f"replayed; listening on http://{host}:{port}")
+    return server
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Check-in lookup service for door scanning stations.')
+    parser.add_argument('event_dir', nargs='?', default=DATA_DIR)
+    parser.add_argument('--host', default=CHECKIN_HOST,
+                        help='address to listen on; 0.0.0.0 for scanner stations on other machines (trusted network only)')
+    parser.add_argument('--port', type=int, default=CHECKIN_PORT)
+    args = parser.parse_args(argv)
+    server = serve(args.event_dir, args.host, args.port)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == '__main__':
+    main()
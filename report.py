@@ -0,0 +1,101 @@
+import argparse
+import json
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+from revenue import merge_cubes, revenue_cube, revenue_rollups
+from seating import (
+    EVENT_MANIFEST, build_seat_map_html, build_seat_registry, build_seat_table, day_seat_status, file_sha256,
+    explode_seats, gallery_summary, generate_master_seat_map, load_bookings, load_event, load_seat_rules,
+    organize_seats, resolve_patrons, style_seat_table, unmapped_seats,
+)
+
+# Written last into each event's output directory; holds the input hashes the reports were built from
+REPORT_STATE = 'report_state.json'
+
+def event_slug(event):
+    return re.sub(r'[^A-Za-z0-9]+', '-', event['name']).strip('-').lower()
+
+def event_input_hashes(event):
+    # Every file the reports depend on: manifest, venue files and booking exports
+    paths = {
+        'manifest': os.path.join(event['dir'], EVENT_MANIFEST),
+        'seat_map': event['seat_map'],
+        'rules': event['rules'],
+    }
+    paths.update({f'source:{key}': source['path'] for key, source in event['sources'].items()})
+    return {name: file_sha256(path) for name, path in sorted(paths.items())}
+
+def write_event_report(event_dir, out_root, force=False):
+    event = load_event(event_dir)
+    out_dir = os.path.join(out_root, event_slug(event))
+    state_path = os.path.join(out_dir, REPORT_STATE)
+    hashes = event_input_hashes(event)
+    if not force and os.path.exists(state_path):
+        with open(state_path, encoding='utf-8') as f:
+            if json.load(f).get('inputs') == hashes:
+                return event['name'], 'unchanged, skipped'
+    os.makedirs(out_dir, exist_ok=True)
+
+    bookings = load_bookings(event)
+    seats = explode_seats(bookings)
+    registry = build_seat_registry(generate_master_seat_map(event['seat_map']), event['galleries'])
+    # Seat lists in the summary follow the seat table (master seat map) order
+    by_seat_id = registry['ids'].get
+    seat_df, double_booked, mismatch_rows, twoday_pass_rows, seat_index, styles = build_seat_table(
+        event, seats, registry, resolve_patrons(bookings))
+    seat_df.to_csv(os.path.join(out_dir, 'seat_table.csv'), index=False)
+    with open(os.path.join(out_dir, 'seat_table.html'), 'w', encoding='utf-8') as f:
+        f.write(style_seat_table(seat_df, styles).to_html())
+
+    rules = load_seat_rules(event['rules'])
+    summary = {
+        'event': event['name'],
+        'mismatch': sorted(mismatch_rows, key=by_seat_id),
+        'pass_fill': sorted(twoday_pass_rows, key=by_seat_id),
+        'unknown_seats': unmapped_seats(seats, registry)[['date', 'seat', 'name', 'confirmation']].to_dict('records'),
+        'days': {},
+    }
+    for day, label in event['days'].items():
+        status_df = day_seat_status(event, registry, seat_index, day, rules)
+        with open(os.path.join(out_dir, f'seat_map_{day}.html'), 'w', encoding='utf-8') as f:
+            f.write(f'<h3>{label} - Visual Seat Map</h3>\n')
+            f.write(build_seat_map_html(registry, seat_index, day, status_df))
+        _, _, _, unallocated = organize_seats(seats[seats['date'] == day])
+        summary['days'][day] = {
+            'label': label,
+            'galleries': gallery_summary(status_df, event['galleries']),
+            'double_booked': sorted(double_booked[day], key=by_seat_id),
+            'unallocated': unallocated,
+        }
+    cube = merge_cubes([revenue_cube(event, key, bookings[bookings['__source'] == key], registry)
+                        for key in event['sources']])
+    for name, table in revenue_rollups(cube).items():
+        table.to_csv(os.path.join(out_dir, f"revenue_by_{name.replace(' ', '_')}.csv"), index=False)
+    with open(os.path.join(out_dir, 'summary.json'), 'w', encoding='utf-8') as f:
+        json.dump(summary, f, indent=2, ensure_ascii=False)
+
+    with open(state_path, 'w', encoding='utf-8') as f:
+        json.dump({'event': event['name'], 'inputs': hashes}, f, indent=2)
+    return event['name'], f'written to {out_dir}'
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Write seat table, seat map and gallery reports without Streamlit.')
+    parser.add_argument('event_dirs', nargs='+', help='directories holding an event.json manifest')
+    parser.add_argument('--out', default='reports', help='output root; one sub-directory per event (default: reports)')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes (default: one per CPU)')
+    parser.add_argument('--force', action='store_true', help='rebuild reports even if their inputs are unchanged')
+    args = parser.parse_args(argv)
+
+    if len(args.event_dirs) == 1 or args.workers == 1:
+        results = [write_event_report(d, args.out, args.force) for d in args.event_dirs]
+    else:
+        with ProcessPoolExecutor(max_workers=args.workers) as pool:
+            results = list(pool.map(write_event_report, args.event_dirs,
+                                    [args.out] * len(args.event_dirs), [args.force] * len(args.event_dirs)))
+    for name, outcome in results:
+        print(f'{name}: {outcome}')
+
+if __name__ == '__main__':
+    main()
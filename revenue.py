@@ -0,0 +1,91 @@
+import numpy as np
+import pandas as pd
+
+from seating import seat_ids
+from timing import stage
+
+# Export money columns and the names they get in the rollups
+MONEY_COLUMNS = {
+    'Total': 'total',
+    'Buyer Paid Total': 'buyer_paid',
+    'Gateway fee': 'gateway_fee',
+    'Tugoz fee': 'tugoz_fee',
+    'Estimated income': 'income',
+    'Discount': 'discount',
+}
+# Finest grain kept; every rollup is a sum over some of these
+CUBE_KEYS = ['date', 'pass', 'ticket', 'coupon', 'gallery']
+CUBE_VALUES = ['bookings', 'seats'] + list(MONEY_COLUMNS.values())
+# Rollups shown in the app and written by report.py: name -> cube keys grouped by
+ROLLUPS = {
+    'day': ['date'],
+    'pass type': ['pass'],
+    'ticket type': ['ticket'],
+    'coupon': ['coupon'],
+    'gallery': ['gallery'],
+}
+NO_COUPON, NO_GALLERY, UNALLOCATED, UNKNOWN_SEAT = '(none)', '(no gallery)', '(no seat)', '(not in venue map)'
+
+def money_values(values):
+    # Export money cells as floats: thousands separators, currency signs and spaces are dropped, so
+    # '$1,200.00' is 1200.0; blank or unreadable cells are NaN
+    text = values.astype('string').str.replace(r'[,$\s]', '', regex=True)
+    return pd.to_numeric(text, errors='coerce').astype('float64')
+
+def empty_cube():
+    return pd.DataFrame(columns=CUBE_KEYS + CUBE_VALUES).astype({c: 'float64' for c in CUBE_VALUES})
+
+def revenue_cube(event, key, bookings, registry):
+    # Sums per (day, pass type, ticket type, coupon, gallery) for tagged rows of one export, in one groupby.
+    # A booking's money is split evenly over the days of its pass and over its seats; 'bookings' and
+    # 'seats' count each day a booking or seat is used, so they add up across galleries but not across days.
+    with stage('revenue_cube', rows=len(bookings), source=key) as counters:
+        if not len(bookings):
+            return empty_cube()
+        source = event['sources'][key]
+        raw = bookings['Seats'].fillna('').astype(str).str.strip()
+        raw = raw.mask(raw.str.lower() == 'nan', '')
+        coupon = bookings['Coupon Code'].astype(object).fillna('').astype(str).str.strip().str.upper()
+        frame = pd.DataFrame({
+            'row': np.arange(len(bookings)),
+            'date': bookings['__date'].to_numpy(),
+            'pass': source['pass'],
+            'ticket': bookings['Short name'].astype(object).fillna('').to_numpy(),
+            'coupon': coupon.mask(coupon == '', NO_COUPON).to_numpy(),
+            'seat': raw.str.split(',').to_numpy(),
+            **{name: money_values(bookings[column]).fillna(0).to_numpy()
+               for column, name in MONEY_COLUMNS.items()},
+        }).explode('seat', ignore_index=True)
+        frame['seat'] = frame['seat'].astype(str).str.strip()
+        # Seat lists like 'A1, ' leave empty items; a booking without seats keeps one row
+        per_row = np.bincount(frame['row'], weights=(frame['seat'] != ''), minlength=len(bookings))
+        frame = frame[(frame['seat'] != '') | (per_row[frame['row']] == 0)]
+        ids = seat_ids(registry, frame['seat'])
+        gallery = registry['layout']['gallery'].fillna(NO_GALLERY).to_numpy()[np.maximum(ids, 0)]
+        gallery = np.where(ids < 0, UNKNOWN_SEAT, gallery)
+        frame['gallery'] = np.where(frame['seat'] == '', UNALLOCATED, gallery)
+        shares = np.maximum(per_row, 1)[frame['row']]
+        frame['bookings'] = 1 / shares
+        frame['seats'] = (frame['seat'] != '').astype(float)
+        for name in MONEY_COLUMNS.values():
+            frame[name] = frame[name] / shares / len(source['days'])
+        cube = frame.groupby(CUBE_KEYS, sort=False)[CUBE_VALUES].sum().reset_index()
+        counters['cells'] = len(cube)
+    return cube
+
+def merge_cubes(cubes, signs=None):
+    # Sum of cubes cell by cell (signs of -1 take a cube away); cells that end up empty are dropped
+    cubes = [cube if sign > 0 else cube.assign(**{c: -cube[c] for c in CUBE_VALUES})
+             for cube, sign in zip(cubes, signs or [1] * len(cubes)) if len(cube)]
+    if not cubes:
+        return empty_cube()
+    merged = pd.concat(cubes, ignore_index=True).groupby(CUBE_KEYS, sort=False)[CUBE_VALUES].sum().reset_index()
+    return merged[merged[CUBE_VALUES].abs().max(axis=1) > 1e-9].reset_index(drop=True)
+
+def rollup(cube, keys):
+    # One rollup (e.g. by day) of a cube, money rounded to cents
+    out = cube.groupby(keys)[CUBE_VALUES].sum()
+    return out.round({name: 2 for name in MONEY_COLUMNS.values()}).round({'bookings': 1}).reset_index()
+
+def revenue_rollups(cube):
+    return {name: rollup(cube, keys) for name, keys in ROLLUPS.items()}
@@ -0,0 +1,953 @@
+import pandas as pd
+import os
+import re
+import json
+import difflib
+import hashlib
+import tempfile
+import numpy as np
+from timing import stage
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+except ImportError:  # snapshots are an optional speed-up; without pyarrow every load parses the CSV
+    pa = feather = None
+
+# Seat status codes used by the compiled blocking rules
+STATUS_AVAILABLE, STATUS_BOOKED, STATUS_BLOCKED = 0, 1, 2
+
+# Gallery groupings
+GALLERY_MAP = {
+    'Celebrity Gallery': [chr(x) for x in range(ord('A'), ord('K')+1)],
+    'Orchestra Gallery': [chr(x) for x in range(ord('L'), ord('V')+1)],
+    'Mezzanine Level': ['AA', 'BB', 'CC', 'DD', 'EE', 'FF'],
+    'Balcony': ['GG', 'HH', 'JJ', 'KK', 'LL', 'MM']
+}
+
+# File paths
+DATA_DIR = 'data'
+EVENT_MANIFEST = 'event.json'
+MASTER_SEAT_MAP = os.path.join(DATA_DIR, 'master_seat_map.csv')
+SEAT_RULES = os.path.join(DATA_DIR, 'seat_rules.json')
+PASS_TYPES = ('single-day', 'multi-day', 'all-days')
+
+# Export columns the seat logic reads; the rest (addresses, card strings, transaction IDs, ...) are never loaded
+INGEST_DTYPES = {
+    'Confirmation': 'string',
+    'First Name': 'string',
+    'Last Name': 'string',
+    'Seats': 'string',
+    # Door check-in lookups
+    'Email': 'string',
+    'Phone': 'string',
+    'Checked in': 'string',
+    'Checkin Time': 'string',
+    # Party size for bookings that still need seats
+    'Ticket Count': 'string',
+    # Revenue rollups; money stays text here ('1,200.00') and is parsed by revenue.money_values
+    'Short name': 'string',
+    'Coupon Code': 'string',
+    'Total': 'string',
+    'Buyer Paid Total': 'string',
+    'Gateway fee': 'string',
+    'Tugoz fee': 'string',
+    'Estimated income': 'string',
+    'Discount': 'string',
+}
+INGEST_CHUNK_ROWS = 100000
+# Arrow snapshots of parsed exports, kept next to the exports of each event
+SNAPSHOT_DIR = '.snapshots'
+
+# Identity resolution: name words that say nothing about who the patron is ('Sachin Khedekar' / 'Family').
+# Honorifics stay in the key: 'Mr Paranjape' and 'Mrs Paranjape' are different people.
+PATRON_NAME_FILLERS = {'family', 'guest', 'guests'}
+# Words of a name key that is no name at all: blank cells format as 'nan'. Such keys ('nan nan', 'guest')
+# link nothing by name.
+PATRON_BLANK_WORDS = PATRON_NAME_FILLERS | {'nan'}
+# Blocks of names sharing an email, a phone or a phonetic key are compared pairwise, so their size is
+# capped; bigger blocks (an organiser address used for many guests) are not evidence of one patron
+PATRON_BLOCK_LIMIT = 25
+# difflib ratio two name words need to be the same word: when the names share an email or phone, and on sound alone
+PATRON_CONTACT_SIMILARITY = 0.8
+PATRON_NAME_SIMILARITY = 0.9
+SOUNDEX_CODES = {c: str(d) for d, letters in enumerate(['aeiouyhw', 'bfpv', 'cgjkqsxz', 'dt', 'l', 'mn', 'r'])
+                 for c in letters}
+
+# Seat table highlight colors
+DAY_PALETTE = ['#fff2cc', '#cce6ff', '#d6f5d6', '#e8d9ff', '#ffe0cc', '#d9f2f2', '#f2d9e6', '#e6e6e6']
+CELL_COLORS = {
+    'double_booked': '#ffcccc',
+    'pass': '#ffd699',  # orange: multi-day pass seat that is blank or different on the reference day
+}
+ROW_COLORS = {
+    'balcony': '#ffa500',  # GG-MM rows are always orange
+    'pass_fill': '#90EE90',  # light green for 2-day pass rows
+    'mismatch': '#fff3b0',  # yellow for mismatch rows
+}
+
+def load_event(event_dir=DATA_DIR):
+    # Event manifest: days, export files with their pass types, and the venue map
+    with open(os.path.join(event_dir, EVENT_MANIFEST), encoding='utf-8') as f:
+        manifest = json.load(f)
+    all_days = [d['date'] for d in manifest['days']]
+    sources = {}
+    for source in manifest['sources']:
+        if not source.get('enabled', True):
+            continue
+        if source['pass'] not in PASS_TYPES:
+            raise ValueError(f"Unknown pass type {source['pass']!r} for {source['file']}")
+        days = all_days if source['pass'] == 'all-days' else source['days']
+        if source['pass'] == 'single-day' and len(days) != 1:
+            raise ValueError(f"Single-day source {source['file']} must list exactly one day")
+        sources[source['key']] = {'path': os.path.join(event_dir, source['file']), 'pass': source['pass'], 'days': list(days)}
+    venue = manifest.get('venue', {})
+    return {
+        'name': manifest['name'],
+        'title': manifest.get('title', manifest['name']),
+        'dir': event_dir,
+        'days': {d['date']: d['label'] for d in manifest['days']},
+        'day_colors': {d['date']: d.get('color', DAY_PALETTE[i % len(DAY_PALETTE)]) for i, d in enumerate(manifest['days'])},
+        'reference_day': manifest.get('reference_day', all_days[0]),
+        'sources': sources,
+        'seat_map': os.path.join(event_dir, venue.get('seat_map', 'master_seat_map.csv')),
+        'rules': os.path.join(event_dir, venue.get('rules', 'seat_rules.json')),
+        'galleries': venue.get('galleries', GALLERY_MAP),
+    }
+
+def find_events(root=DATA_DIR):
+    # The data directory itself and any sub-directory holding an event manifest
+    dirs = [root] + sorted(os.path.join(root, d) for d in os.listdir(root) if os.path.isdir(os.path.join(root, d)))
+    return [d for d in dirs if os.path.exists(os.path.join(d, EVENT_MANIFEST))]
+
+def day_column(event, day):
+    return f"{event['days'][day]} (Name/s)"
+
+# Helper to get full name
+def get_full_name(row):
+    return f"{row['First Name']} {row['Last Name']}".strip()
+
+def full_names(df):
+    # Vectorized get_full_name over a whole export (blank cells format as 'nan', same as the f-string)
+    first = df['First Name'].astype(object).fillna('nan').astype(str)
+    last = df['Last Name'].astype(object).fillna('nan').astype(str)
+    return (first + ' ' + last).str.strip()
+
+def normalize_name(name):
+    # Lower case words without punctuation or filler words, sorted, so 'Chandrakant  Patel ',
+    # 'Patel Chandrakant' and 'Chandrakant Patel Family' compare equal (honorifics are kept)
+    words = [w for w in re.split(r'[^a-z0-9]+', name.lower()) if w]
+    return ' '.join(sorted(w for w in words if w not in PATRON_NAME_FILLERS)) or ' '.join(words)
+
+def name_keys(names):
+    # normalize_name per row, computed once per distinct name
+    codes, uniques = pd.factorize(names.astype(object).fillna(''))
+    return np.array([normalize_name(str(u)) for u in uniques], dtype=object)[codes]
+
+def email_keys(emails):
+    # Lower case, without +tags; gmail also ignores dots in the local part. '' when there is no address.
+    parts = emails.astype(object).fillna('').astype(str).str.strip().str.lower().str.extract(
+        r'^([^@+\s]+)(?:\+[^@]*)?@([^@\s]+)$')
+    local = parts[0].where(~parts[1].isin(['gmail.com', 'googlemail.com']), parts[0].str.replace('.', '', regex=False))
+    return (local + '@' + parts[1]).fillna('').to_numpy(dtype=object)
+
+def phone_keys(phones):
+    # Digits only, without a leading US country code; '' when too short to identify anyone
+    digits = phones.astype(object).fillna('').astype(str).str.replace(r'\.0$|\D', '', regex=True)
+    digits = digits.where(~((digits.str.len() == 11) & digits.str.startswith('1')), digits.str[1:])
+    return digits.where(digits.str.len() >= 7, '').to_numpy(dtype=object)
+
+def soundex(word):
+    # Classic soundex: first letter plus up to three consonant group digits
+    if not word[0].isalpha():
+        return word
+    digits = [SOUNDEX_CODES.get(c, '0') for c in word]
+    code = [d for i, d in enumerate(digits[1:], 1) if d != '0' and d != digits[i - 1]]
+    return (word[0] + ''.join(code) + '000')[:4]
+
+def names_match(a, b, threshold):
+    # Normalized names a and b as one patron: every word of the shorter name is (nearly) a word of the
+    # other, so a typo or an added middle name still matches but 'aish kalley' and 'harshit kalley' do not
+    short, long = sorted((a.split(), b.split()), key=len)
+    return all(any(w == v or difflib.SequenceMatcher(None, w, v).ratio() >= threshold for v in long) for w in short)
+
+def connected_labels(n, a, b):
+    # Component label (smallest member) for n nodes linked by edges a[i]-b[i]: min-label propagation with
+    # pointer jumping, a handful of vectorized passes rather than a Python union-find
+    labels = np.arange(n)
+    while True:
+        new = labels.copy()
+        np.minimum.at(new, a, labels[b])
+        np.minimum.at(new, b, labels[a])
+        new = new[new]
+        if np.array_equal(new, labels):
+            return labels
+        labels = new
+
+def phonetic_keys(keys):
+    # Sorted soundex codes of the words of each name key
+    words = [key.split() for key in keys]
+    sounds = {w: soundex(w) for w in set().union(*words)}
+    return np.array([' '.join(sorted(sounds[w] for w in key_words)) for key_words in words], dtype=object)
+
+def patron_blocks(groups, nodes):
+    # Distinct nodes of each group (same email, phone or phonetic key) holding 2..PATRON_BLOCK_LIMIT of them
+    members = pd.DataFrame({'group': groups, 'node': nodes})
+    members = members[members['group'] != ''].drop_duplicates()
+    size = members.groupby('group', sort=False)['node'].transform('size')
+    members = members[(size > 1) & (size <= PATRON_BLOCK_LIMIT)]
+    node = members['node'].to_numpy()
+    return [node[i] for i in members.groupby('group', sort=False).indices.values()]
+
+def blank_name_key(key):
+    return all(w in PATRON_BLANK_WORDS for w in key.split())
+
+def contacts_conflict(a, b):
+    # Two (emails, phones) contact sets belong to different people: they share no email or phone, and an
+    # email or a phone is known on both sides and differs
+    shared = a[0] & b[0] or a[1] & b[1]
+    return not shared and bool(a[0] and b[0] or a[1] and b[1])
+
+def resolve_patrons(bookings):
+    # Patron id for every booking, by confirmation. Bookings are first grouped into identities (same name
+    # key, email and phone). Identities whose names match inside blocks sharing an email or a phone are
+    # linked outright; names are only compared inside such blocks or phonetic blocks, so the work stays
+    # near-linear. Identities with the same name key, and same-sounding names, are only merged when the
+    # patrons they would join have no conflicting email or phone, so two people with one name stay apart.
+    # A patron id is the smallest name key of its patron, with ' #2', ' #3'... when several patrons share it.
+    with stage('resolve_patrons', rows=len(bookings)) as counters:
+        keys = bookings['__key'].to_numpy(dtype=object)
+        emails = email_keys(bookings['Email'])
+        phones = phone_keys(bookings['Phone'])
+        # Nodes (identities) are numbered in key order, so a component's smallest node has its smallest key
+        # ('\x01' sorts before any character of a key; NumPy would strip a '\0' separator)
+        node, _ = pd.factorize(keys + '\x01' + emails + '\x01' + phones, sort=True)
+        first = np.unique(node, return_index=True)[1]
+        node_keys, node_emails, node_phones = keys[first], emails[first], phones[first]
+        n = len(first)
+        pairs = []
+        blocks = patron_blocks(node_emails, np.arange(n)) + patron_blocks(node_phones, np.arange(n))
+        for block in blocks:
+            pairs += [(x, y) for i, x in enumerate(block) for y in block[i + 1:]
+                      if names_match(node_keys[x], node_keys[y], PATRON_CONTACT_SIMILARITY)]
+        counters['contact_comparisons'] = sum(len(block) * (len(block) - 1) // 2 for block in blocks)
+        edges = np.array(pairs, dtype=np.int64).reshape(-1, 2)
+        labels = connected_labels(n, edges[:, 0], edges[:, 1])
+
+        # Guarded merges: a union-find over the components above, carrying each component's contacts
+        roots = np.unique(labels)
+        parent = {root: root for root in roots.tolist()}
+        contacts = {root: (set(), set()) for root in parent}
+        for label, email, phone in zip(labels.tolist(), node_emails, node_phones):
+            if email:
+                contacts[label][0].add(email)
+            if phone:
+                contacts[label][1].add(phone)
+
+        def find(x):
+            while parent[x] != x:
+                parent[x] = parent[parent[x]]
+                x = parent[x]
+            return x
+
+        def union(x, y):
+            x, y = find(int(labels[x])), find(int(labels[y]))
+            if x == y:
+                return True
+            if contacts_conflict(contacts[x], contacts[y]):
+                return False
+            x, y = min(x, y), max(x, y)
+            parent[y] = x
+            contacts[x] = (contacts[x][0] | contacts[y][0], contacts[x][1] | contacts[y][1])
+            return True
+
+        # Same name key (contiguous, nodes are in key order): each identity joins the first patron of that key
+        # it does not conflict with. Only the key's first PATRON_BLOCK_LIMIT patrons are tried, so a key shared
+        # by many different people costs linear time; blank keys are skipped.
+        starts = np.flatnonzero(np.r_[True, node_keys[1:] != node_keys[:-1]])
+        stops = np.r_[starts[1:], n]
+        named = np.array([not blank_name_key(key) for key in node_keys[starts]], dtype=bool)
+        grouped = named & (stops - starts > 1)
+        comparisons = 0
+        for start, stop in zip(starts[grouped].tolist(), stops[grouped].tolist()):
+            key_patrons = [start]  # first node of each patron of this key so far
+            for y in range(start + 1, stop):
+                for x in key_patrons:
+                    comparisons += 1
+                    if union(x, y):
+                        break
+                else:
+                    if len(key_patrons) < PATRON_BLOCK_LIMIT:
+                        key_patrons.append(y)
+        counters['key_comparisons'] = comparisons
+        # Same-sounding names without a shared contact
+        blocks = patron_blocks(phonetic_keys(node_keys[starts[named]]), starts[named])
+        counters['phonetic_comparisons'] = sum(len(block) * (len(block) - 1) // 2 for block in blocks)
+        for block in blocks:
+            for i, x in enumerate(block):
+                for y in block[i + 1:]:
+                    if names_match(node_keys[x], node_keys[y], PATRON_NAME_SIMILARITY):
+                        union(x, y)
+        components = np.array([find(int(label)) for label in labels])
+
+        # Patron ids: the component's smallest key, numbered when several components share it
+        ids = pd.Series(node_keys[components])
+        rank = pd.Series(components).groupby(ids.to_numpy()).rank(method='dense').astype(int).to_numpy()
+        ids = np.where(rank > 1, ids + ' #' + rank.astype(str), ids)
+        counters['patrons'] = len(np.unique(components))
+        counters['identities'] = n
+        patron = pd.Series(ids[node], index=bookings['Confirmation'].to_numpy(), name='patron')
+    return patron[patron.index.notna() & ~patron.index.duplicated()]
+
+def patron_links(bookings):
+    # Per booking row, every value resolve_patrons can link it to another booking through
+    keys = bookings['__key'].to_numpy(dtype=object)
+    codes, uniques = pd.factorize(keys)
+    return pd.DataFrame({
+        'confirmation': bookings['Confirmation'].to_numpy(dtype=object),
+        'key': keys,
+        'email': email_keys(bookings['Email']),
+        'phone': phone_keys(bookings['Phone']),
+        'phonetic': phonetic_keys(uniques)[codes],
+    })
+
+def patron_cluster(links, seeds):
+    # Rows of links (patron_links of all bookings) reachable from the seed rows through shared values.
+    # Patrons and name comparison blocks never cross such a cluster, so resolve_patrons over the cluster's
+    # bookings alone gives them the patrons it gives over all bookings.
+    member = np.zeros(len(links), dtype=bool)
+    while len(seeds):
+        hit = np.zeros(len(links), dtype=bool)
+        for column in links.columns:
+            values = seeds[column].dropna()
+            if column != 'key':
+                values = values[values != '']  # a missing email, phone or sound links nothing; an empty name does
+            hit |= links[column].isin(values.unique()).to_numpy()
+        seeds = links[hit & ~member]
+        member |= hit
+    return member
+
+def file_sha256(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+def snapshot_path(path):
+    # Snapshot name ties it to the export's size and modification time (a stat, not a read of the file)
+    # and to the column set it was pruned to
+    stat = os.stat(path)
+    columns_key = hashlib.sha256(json.dumps(INGEST_DTYPES, sort_keys=True).encode()).hexdigest()[:8]
+    name = f"{os.path.basename(path)}.{stat.st_size}-{stat.st_mtime_ns}.{columns_key}.arrow"
+    return os.path.join(os.path.dirname(path), SNAPSHOT_DIR, name)
+
+def read_export_csv(path, **kwargs):
+    return pd.read_csv(path, usecols=lambda c: c in INGEST_DTYPES, dtype=INGEST_DTYPES, **kwargs)
+
+def write_snapshot(path, snapshot):
+    # Parses the CSV chunk by chunk straight into an Arrow file, so only one chunk is in memory at a time.
+    # Returns the number of rows written.
+    folder, name = os.path.split(snapshot)
+    os.makedirs(folder, exist_ok=True)
+    # Drop snapshots of earlier versions of the same export; .tmp files are other writers' work in progress
+    prefix = name.split('.arrow')[0].rsplit('.', 2)[0] + '.'
+    for old in os.listdir(folder):
+        if old.startswith(prefix) and old != name and not old.endswith('.tmp'):
+            try:
+                os.remove(os.path.join(folder, old))
+            except FileNotFoundError:  # already removed by another writer
+                pass
+    # A temporary file of our own, so concurrent writers of the same snapshot never share one
+    fd, tmp = tempfile.mkstemp(dir=folder, prefix=name + '.', suffix='.tmp')
+    os.close(fd)
+    writer, rows = None, 0
+    try:
+        try:
+            for chunk in read_export_csv(path, chunksize=INGEST_CHUNK_ROWS):
+                batches = pa.Table.from_pandas(chunk, preserve_index=False)
+                if writer is None:
+                    writer = pa.ipc.new_file(tmp, batches.schema)
+                writer.write_table(batches)
+                rows += len(chunk)
+            if writer is None:  # header only
+                empty = pa.Table.from_pandas(read_export_csv(path), preserve_index=False)
+                writer = pa.ipc.new_file(tmp, empty.schema)
+        finally:
+            if writer is not None:
+                writer.close()
+        os.replace(tmp, snapshot)
+    except BaseException:
+        os.remove(tmp)
+        raise
+    return rows
+
+def read_export(path):
+    # Pruned, typed export. The first read streams the CSV into an Arrow snapshot; every read then
+    # memory-maps the snapshot. String columns stay Arrow-backed views into the map, only the numeric
+    # columns are copied out.
+    snapshot = snapshot_path(path) if pa is not None else None
+    if snapshot and not os.path.exists(snapshot):
+        try:
+            with stage('write_snapshot', file=os.path.basename(path)) as counters:
+                counters['rows'] = write_snapshot(path, snapshot)
+        except (OSError, pa.ArrowInvalid):
+            snapshot = None  # read-only event directory: keep working from the CSV
+    if snapshot is not None:
+        try:
+            with stage('read_export (snapshot)', file=os.path.basename(path)) as counters:
+                df = feather.read_table(snapshot, memory_map=True).to_pandas()
+                counters['rows'] = len(df)
+            return df
+        except (OSError, pa.ArrowInvalid):
+            # Torn or unreadable snapshot: drop it so the next read writes a fresh one, and use the CSV now
+            try:
+                os.remove(snapshot)
+            except OSError:
+                pass
+    with stage('read_export (csv)', file=os.path.basename(path)) as counters:
+        df = read_export_csv(path)
+        counters['rows'] = len(df)
+    return df
+
+def read_source(event, key):
+    # Bookings from one export file; multi-day passes are fanned out to each of their dates
+    return tag_bookings(event, key, read_export(event['sources'][key]['path']))
+
+def tag_bookings(event, key, df):
+    # Date, source, full name and normalized name columns for rows of one export
+    source = event['sources'][key]
+    if source['pass'] == 'single-day':
+        df = df.assign(__date=source['days'][0], __source=key)
+    else:
+        df = df.assign(__date=[list(source['days'])] * len(df), __source=key).explode('__date')
+    df['__name'] = full_names(df)
+    df['__key'] = name_keys(df['__name'])
+    return df
+
+def load_bookings(event):
+    # One row per booking per date
+    return pd.concat([read_source(event, key) for key in event['sources']], ignore_index=True)
+
+def day_source_keys(event, day):
+    # Export files whose bookings count towards the given day
+    return [key for key, source in event['sources'].items() if day in source['days']]
+
+def pass_source_keys(event):
+    return [key for key, source in event['sources'].items() if source['pass'] != 'single-day']
+
+def explode_seats(bookings):
+    # Tidy (date, seat, name, key, source, confirmation) frame, one row per booked seat.
+    # Bookings without any seat keep a single row with an empty seat.
+    with stage('explode_seats', rows=len(bookings)) as counters:
+        raw = bookings['Seats'].fillna('').astype(str).str.strip()
+        raw = raw.mask(raw.str.lower() == 'nan', '')
+        tidy = pd.DataFrame({
+            'date': bookings['__date'].to_numpy(),
+            'seat': raw.str.split(',').to_numpy(),
+            'name': bookings['__name'].to_numpy(),
+            'key': bookings['__key'].to_numpy(),
+            'source': bookings['__source'].to_numpy(),
+            'confirmation': bookings['Confirmation'].to_numpy(),
+            '__raw': raw.to_numpy(),
+        }).explode('seat', ignore_index=True)
+        tidy['seat'] = tidy['seat'].astype(str).str.strip()
+        tidy = tidy[(tidy['seat'] != '') | (tidy['__raw'] == '')]
+        counters['seats'] = len(tidy)
+    return tidy.drop(columns='__raw').reset_index(drop=True)
+
+def load_and_normalize(event):
+    return explode_seats(load_bookings(event))
+
+def generate_master_seat_map(path=MASTER_SEAT_MAP):
+    master_df = pd.read_csv(path)
+    seat_map = []
+    for _, row in master_df.iterrows():
+        row_label = str(row['Row'])
+        # Center seats
+        try:
+            center_start = int(row['Center Start'])
+            center_end = int(row['Center End'])
+            center_seats = [f"{row_label}{num}" for num in range(center_start, center_end + 1)]
+        except:
+            center_seats = []
+        # Side seats
+        try:
+            side_start = int(row['Sides Start'])
+            side_end = int(row['Sides End'])
+            if side_start != 0 and side_end != 0:
+                side_seats = [f"{row_label}{num}" for num in range(side_start, side_end + 1)]
+            else:
+                side_seats = []
+        except:
+            side_seats = []
+        seat_map.append({
+            'row': row_label,
+            'center': center_seats,
+            'side': side_seats
+        })
+    return seat_map
+
+def generate_master_seat_list(seat_map=None):
+    if seat_map is None:
+        seat_map = generate_master_seat_map()
+    seat_list = []
+    for row in seat_map:
+        seat_list.extend(row['center'])
+        seat_list.extend(row['side'])
+    return seat_list
+
+def seat_layout(seat_map, galleries=GALLERY_MAP):
+    # One row per seat, in master seat list order, with the attributes the blocking rules select on
+    rows = []
+    for row in seat_map:
+        row_label = row['row']
+        for seat in row['center']:
+            rows.append((seat, row_label, int(seat[len(row_label):]), 'center'))
+        for seat in row['side']:
+            number = int(seat[len(row_label):])
+            rows.append((seat, row_label, number, 'right' if number % 2 == 0 else 'left'))
+    layout = pd.DataFrame(rows, columns=['seat', 'row', 'number', 'section'])
+    layout['parity'] = np.where(layout['number'] % 2 == 0, 'even', 'odd')
+    row_to_gallery = {r: gallery for gallery, gallery_rows in galleries.items() for r in gallery_rows}
+    layout['gallery'] = layout['row'].map(row_to_gallery)
+    return layout
+
+def build_seat_registry(seat_map, galleries=GALLERY_MAP):
+    # Dense integer id per seat (its position in the master seat list) plus everything later stages
+    # need about it, parsed once. Per-seat state elsewhere is a NumPy array indexed by seat id.
+    with stage('build_seat_registry') as counters:
+        layout = seat_layout(seat_map, galleries)
+        display_rows = []  # (row label, left ids, center ids, right ids) in the order they are drawn
+        for row_label, group in layout.groupby('row', sort=False):
+            left = group[group['section'] == 'left'].sort_values('number', ascending=False).index.to_numpy()
+            center = group[group['section'] == 'center'].index.to_numpy()[::-1]
+            right = group[group['section'] == 'right'].sort_values('number').index.to_numpy()
+            display_rows.append((row_label, left, center, right))
+        counters['seats'] = len(layout)
+    return {
+        'layout': layout,
+        'size': len(layout),
+        'ids': {seat: seat_id for seat_id, seat in enumerate(layout['seat'])},
+        'display_rows': display_rows,
+    }
+
+def seat_ids(registry, seats):
+    # Seat labels to ids; seats that are not in the venue map get -1
+    return seats.map(registry['ids']).fillna(-1).astype(np.int64).to_numpy()
+
+def unmapped_seats(seats, registry):
+    # Booked seats that do not exist in the venue map
+    allocated = seats[seats['seat'] != '']
+    return allocated[seat_ids(registry, allocated['seat']) < 0].reset_index(drop=True)
+
+def load_seat_rules(path=SEAT_RULES):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+def select_seats(layout, selector, row_order):
+    # Boolean mask over the layout for one rule; every key given narrows the selection
+    mask = np.ones(len(layout), dtype=bool)
+    if 'rows' in selector:
+        mask &= layout['row'].isin(selector['rows']).to_numpy()
+    if 'row_range' in selector:
+        first, last = (row_order.index(r) for r in selector['row_range'])
+        mask &= layout['row'].isin(row_order[first:last + 1]).to_numpy()
+    if 'seats' in selector:
+        mask &= layout['seat'].isin(selector['seats']).to_numpy()
+    if 'numbers' in selector:
+        low, high = selector['numbers']
+        mask &= layout['number'].between(low, high).to_numpy()
+    if 'parity' in selector:
+        mask &= (layout['parity'] == selector['parity']).to_numpy()
+    if 'section' in selector:
+        mask &= (layout['section'] == selector['section']).to_numpy()
+    return mask
+
+def compile_seat_rules(rules, layout, day):
+    # Booking-independent part of the seat status for one day. Earlier block rules take
+    # precedence over later ones; unblock exceptions release every block that does not
+    # override bookings.
+    row_order = list(dict.fromkeys(layout['row']))
+    blocked = np.zeros(len(layout), dtype=bool)
+    forced = np.zeros(len(layout), dtype=bool)
+    color = np.full(len(layout), rules['colors']['available'], dtype=object)
+    forced_color = color.copy()
+    for rule in reversed(rules['block']):
+        if 'days' in rule and day not in rule['days']:
+            continue
+        mask = select_seats(layout, rule, row_order)
+        if rule.get('override_booking'):
+            forced |= mask
+            forced_color[mask] = rule['color']
+        else:
+            blocked |= mask
+            color[mask] = rule['color']
+    for rule in rules.get('unblock', []):
+        if 'days' in rule and day not in rule['days']:
+            continue
+        blocked &= ~select_seats(layout, rule, row_order)
+    return {'blocked': blocked, 'color': color, 'forced': forced, 'forced_color': forced_color}
+
+def seat_status(compiled, layout, occupied, colors):
+    # Combine compiled rules with the day's occupancy into one status/color array per seat
+    status = np.full(len(layout), STATUS_AVAILABLE, dtype=np.int8)
+    color = np.full(len(layout), colors['available'], dtype=object)
+    status[compiled['blocked']] = STATUS_BLOCKED
+    color[compiled['blocked']] = compiled['color'][compiled['blocked']]
+    status[occupied] = STATUS_BOOKED
+    color[occupied] = colors['booked']
+    status[compiled['forced']] = STATUS_BLOCKED
+    color[compiled['forced']] = compiled['forced_color'][compiled['forced']]
+    return layout.assign(status=status, color=color)
+
+def organize_seats(day_seats):
+    with stage('organize_seats', rows=len(day_seats)) as counters:
+        allocated = day_seats[day_seats['seat'] != '']
+        grouped = allocated.groupby('seat', sort=False)
+        seat_to_names = grouped['name'].agg(list).to_dict()
+        seat_to_sources = grouped['source'].agg(list).to_dict()
+        # (name, source) for each seat
+        pairs = pd.Series(list(zip(allocated['name'], allocated['source'])), index=allocated.index)
+        seat_to_name_sources = pairs.groupby(allocated['seat'], sort=False).agg(list).to_dict()
+        counters['seats'] = len(seat_to_names)
+    return seat_to_names, seat_to_sources, seat_to_name_sources, unallocated_names(day_seats)
+
+def unallocated_names(day_seats):
+    # Names on bookings without a seat, in booking order
+    return day_seats.loc[day_seats['seat'] == '', 'name'].tolist()
+
+def seat_sort_key(seat):
+    m = re.fullmatch(r'([A-Z]{1,2})(\d+)', seat)
+    if m:
+        prefix = m.group(1)
+        number = int(m.group(2))
+        return (0 if len(prefix) == 1 else 1, prefix, number)
+    return (2, seat)
+
+def aggregate_day(event, day_seats, day, registry, names=None):
+    # Per-seat aggregates for a single day, as arrays indexed by seat id; only depends on that day's exports.
+    # names (the joined holder names per seat) can be passed in when already known, e.g. from the archive.
+    size = registry['size']
+    allocated = day_seats[day_seats['seat'] != '']
+    ids = seat_ids(registry, allocated['seat'])
+    known = ids >= 0
+    allocated, ids = allocated[known], ids[known]
+    sources = allocated['source'].to_numpy()
+    pass_keys = pass_source_keys(event)
+    # Seat booked from a single-day export for this day (as opposed to a multi-day pass)
+    own_source = ~np.isin(sources, pass_keys)
+    if names is None:
+        held = (pd.DataFrame({'seat_id': ids, 'name': allocated['name'].to_numpy(dtype=object)})
+                .drop_duplicates().sort_values(['seat_id', 'name']))
+        seat, name = held['seat_id'].to_numpy(), held['name'].to_numpy(dtype=object)
+        names = np.full(size, '', dtype=object)
+        # Most seats have one holder and are filled in directly; only seats shared by several names are joined
+        shared = (np.bincount(seat, minlength=size) > 1)[seat]
+        names[seat[~shared]] = name[~shared]
+        if shared.any():
+            # Sorted by seat, so each shared seat is one run: split at the run starts and join each slice
+            seat, name = seat[shared], name[shared]
+            starts = np.flatnonzero(np.r_[True, seat[1:] != seat[:-1]])
+            names[seat[starts]] = [', '.join(run) for run in np.split(name, starts[1:])]
+    return {
+        'names': names,
+        'own_source': np.bincount(ids[own_source], minlength=size) > 0,
+        # One flag array per multi-day pass source present on this day
+        'pass': {key: np.bincount(ids[sources == key], minlength=size) > 0 for key in pass_keys},
+        # (seat id, normalized name, confirmation, from a pass) per booked seat; compared across days as patrons
+        'pairs': pd.DataFrame({'seat_id': ids, 'key': allocated['key'].to_numpy(),
+                               'confirmation': allocated['confirmation'].to_numpy(), 'pass': ~own_source})
+                 .drop_duplicates(ignore_index=True),
+    }
+
+def aggregate_days(event, day_seats, registry):
+    # aggregate_day for every day, in this process: a day is a few vectorized passes, cheaper than shipping
+    # the frames to worker processes (and no fork from inside the threaded app server)
+    days = list(day_seats)
+    rows = sum(len(seats) for seats in day_seats.values())
+    with stage('aggregate_days', rows=rows, seats=registry['size'], days=len(days)):
+        return {day: aggregate_day(event, seats, day, registry) for day, seats in day_seats.items()}
+
+def patch_day_aggregate(event, agg, day_seats, day, registry, ids):
+    # aggregate_day recomputed for the given seat ids only; returns a new aggregate, agg is not modified
+    if not len(ids):
+        return agg
+    labels = registry['layout']['seat'].to_numpy()[ids]
+    part = aggregate_day(event, day_seats[day_seats['seat'].isin(labels)], day, registry)
+    patched = {}
+    for name in ('names', 'own_source'):
+        patched[name] = agg[name].copy()
+        patched[name][ids] = part[name][ids]
+    patched['pass'] = {}
+    for key, flags in agg['pass'].items():
+        patched['pass'][key] = flags.copy()
+        patched['pass'][key][ids] = part['pass'][key][ids]
+    pairs = agg['pairs']
+    patched['pairs'] = pd.concat([pairs[~pairs['seat_id'].isin(ids)], part['pairs']], ignore_index=True)
+    return patched
+
+def build_seat_table(event, seats, registry=None, patrons=None):
+    if registry is None:
+        registry = build_seat_registry(generate_master_seat_map(event['seat_map']), event['galleries'])
+    day_aggs = aggregate_days(event, {day: seats[seats['date'] == day] for day in event['days']}, registry)
+    with stage('combine_seat_table', seats=registry['size']):
+        return combine_seat_table(event, day_aggs, registry, patrons)
+
+def seat_patrons(pairs, size, patrons=None):
+    # The pairs with each booking resolved to its patron (bookings resolve_patrons has not seen are their
+    # name key), the distinct (seat id, patron) holdings, and how many patrons hold each seat id
+    patron = pairs['key'] if patrons is None else pairs['confirmation'].map(patrons).fillna(pairs['key'])
+    held = pairs.assign(patron=patron.to_numpy())
+    holdings = held.drop_duplicates(['seat_id', 'patron'])[['seat_id', 'patron']]
+    return held, holdings, np.bincount(holdings['seat_id'].to_numpy(), minlength=size)
+
+def seat_sales(pairs, size):
+    # How many different bookings hold each seat id (rows without a confirmation count by name)
+    sold = pairs.assign(booking=pairs['confirmation'].astype(object).fillna(pairs['key']).to_numpy())
+    return np.bincount(sold.drop_duplicates(['seat_id', 'booking'])['seat_id'].to_numpy(), minlength=size)
+
+def same_holders(a, a_counts, b, b_counts):
+    # Per seat id: whether two sets of distinct holdings give the seat the same patrons (both empty included)
+    common = a.merge(b, on=['seat_id', 'patron'])['seat_id'].to_numpy()
+    return (a_counts == b_counts) & (np.bincount(common, minlength=len(a_counts)) == a_counts)
+
+def combine_seat_table(event, day_aggs, registry, patrons=None):
+    # Cross-day flags (multi-day pass fill, mismatch, double booking) and the table/index/styles built from
+    # the per-day aggregates. Seat holders are compared as patrons (see resolve_patrons), not as name strings.
+    layout = registry['layout']
+    size = registry['size']
+    day_keys = list(event['days'])
+    reference_day = event['reference_day']
+    other_days = [day for day in day_keys if day != reference_day]
+    no_seats = np.zeros(size, dtype=bool)
+    names = {day: day_aggs[day]['names'] for day in day_keys}
+    held, holdings, counts, double = {}, {}, {}, {}
+    for day in day_keys:
+        held[day], holdings[day], counts[day] = seat_patrons(day_aggs[day]['pairs'], size, patrons)
+        # Double booked: held by more than one patron, or sold twice (a duplicate sale to one patron included)
+        double[day] = (counts[day] > 1) | (seat_sales(day_aggs[day]['pairs'], size) > 1)
+
+    names_ref = names[reference_day]
+    holdings_ref, counts_ref = holdings[reference_day], counts[reference_day]
+    # Seat held by the same multi-day pass holder(s) on every day of the pass but vacant on the
+    # reference day: fill in the reference day with the same name
+    pass_fill = no_seats.copy()
+    for key, source in event['sources'].items():
+        pass_days = [day for day in source['days'] if day != reference_day]
+        if source['pass'] == 'single-day' or len(pass_days) < 2:
+            continue
+        first = pass_days[0]
+        fill = (counts[first] > 0) & (counts_ref == 0)
+        for day in pass_days:
+            fill &= same_holders(holdings[day], counts[day], holdings[first], counts[first])
+            fill &= day_aggs[day]['pass'].get(key, no_seats)
+        names_ref = np.where(fill, names[first], names_ref)
+        filled = holdings[first][fill[holdings[first]['seat_id'].to_numpy()]]
+        holdings_ref = pd.concat([holdings_ref, filled], ignore_index=True)
+        counts_ref = np.where(fill, counts[first], counts_ref)
+        pass_fill |= fill
+    names[reference_day] = names_ref
+    # Highlight if the reference day and any other day have holders and they are different patrons
+    mismatch = no_seats.copy()
+    for day in other_days:
+        mismatch |= (counts_ref > 0) & (counts[day] > 0) & ~same_holders(holdings_ref, counts_ref, holdings[day], counts[day])
+    # Multi-day pass holder on another day who is not (one of) the reference day patron(s)
+    pass_not_ref = {}
+    for day in other_days:
+        pass_held = held[day].loc[held[day]['pass'], ['seat_id', 'patron']]
+        pairs = pass_held.merge(holdings_ref, on=['seat_id', 'patron'], how='left', indicator=True)
+        not_ref = pairs.loc[pairs['_merge'] == 'left_only', 'seat_id'].to_numpy()
+        pass_not_ref[day] = np.bincount(not_ref, minlength=size) > 0
+
+    seat_labels = layout['seat'].to_numpy()
+    day_columns = {day: day_column(event, day) for day in day_keys}
+    df = pd.DataFrame({'Seat number': seat_labels})
+    for day, col in day_columns.items():
+        df[col] = names[day]
+    mismatch_rows = set(seat_labels[mismatch])
+    twoday_pass_rows = set(seat_labels[pass_fill])  # Track rows that need 2-day pass highlighting
+    double_booked = {day: set(seat_labels[double[day]]) for day in day_keys}
+    # Per-day (names, occupied) arrays indexed by seat id
+    seat_index = {day: (names[day], names[day] != '') for day in day_keys}
+
+    # CSS for every cell, computed in one pass from the masks above
+    styles = pd.DataFrame('', index=df.index, columns=df.columns)
+    for day, col in day_columns.items():
+        is_double = double[day]
+        # The pass highlight compares against the reference day, so it never applies to that day itself
+        pass_cell = pass_not_ref.get(day, no_seats)
+        styles[col] = np.select(
+            [is_double, day_aggs[day]['own_source'], pass_cell],
+            [CELL_COLORS['double_booked'], event['day_colors'][day], CELL_COLORS['pass']],
+            default='')
+    row_prefix = layout['row']
+    row_color = np.select(
+        [row_prefix.isin(event['galleries'].get('Balcony', [])).to_numpy(), pass_fill, mismatch],
+        [ROW_COLORS['balcony'], ROW_COLORS['pass_fill'], ROW_COLORS['mismatch']],
+        default='')
+    has_row_color = row_color != ''
+    styles.loc[has_row_color, :] = np.repeat(row_color[has_row_color][:, None], len(df.columns), axis=1)
+    styles = styles.where(styles == '', 'background-color: ' + styles)
+    return df, double_booked, mismatch_rows, twoday_pass_rows, seat_index, styles
+
+def update_seat_table(event, table, day_aggs, registry, ids, patrons=None):
+    # combine_seat_table rerun on the given seat ids only, patched into copies of a full table's results.
+    # Every cross-day flag depends on a single seat's aggregates, so the other seats are unaffected.
+    ids = np.unique(ids)
+    if not len(ids):
+        return table
+    df, double_booked, mismatch_rows, twoday_pass_rows, seat_index, styles = table
+    position = np.full(registry['size'], -1)
+    position[ids] = np.arange(len(ids))
+    sub_aggs = {}
+    for day, agg in day_aggs.items():
+        pairs = agg['pairs']
+        pairs = pairs[pairs['seat_id'].isin(ids)]
+        sub_aggs[day] = {
+            'names': agg['names'][ids],
+            'own_source': agg['own_source'][ids],
+            'pass': {key: flags[ids] for key, flags in agg['pass'].items()},
+            'pairs': pairs.assign(seat_id=position[pairs['seat_id'].to_numpy()]),
+        }
+    sub_registry = {'layout': registry['layout'].iloc[ids].reset_index(drop=True), 'size': len(ids)}
+    sub_df, sub_double, sub_mismatch, sub_twoday, sub_index, sub_styles = combine_seat_table(event, sub_aggs, sub_registry, patrons)
+    labels = set(sub_df['Seat number'])
+    df = df.copy()
+    df.iloc[ids] = sub_df.to_numpy()
+    styles = styles.copy()
+    styles.iloc[ids] = sub_styles.to_numpy()
+    patched_index = {}
+    for day, (names, occupied) in seat_index.items():
+        names, occupied = names.copy(), occupied.copy()
+        names[ids], occupied[ids] = sub_index[day]
+        patched_index[day] = (names, occupied)
+    return (
+        df,
+        {day: (seats - labels) | sub_double[day] for day, seats in double_booked.items()},
+        (mismatch_rows - labels) | sub_mismatch,
+        (twoday_pass_rows - labels) | sub_twoday,
+        patched_index,
+        styles,
+    )
+
+def style_seat_table(df, styles, start=0, stop=None):
+    # Only the requested page of rows is handed to the Styler
+    page = df.iloc[start:stop]
+    return page.style.apply(lambda _: styles.iloc[start:stop], axis=None)
+
+# Rows followed by a spacer on the seat map
+SEAT_MAP_ROW_GAPS = ['K', 'V', 'FF', 'BB']
+
+# Styles for the seat map HTML; tooltips show the seat's names or status on hover
+SEAT_MAP_CSS = """
+    <style>
+    .seat-row { display: flex; align-items: center; justify-content: center; margin-bottom: 2px; }
+    .seat-box { width: 22px; height: 22px; border: 1px solid #888; margin: 1px; display: flex; align-items: center; justify-content: center; font-size: 0.7em; position: relative; background: #fff; cursor: pointer; }
+    .seat-label { margin-left: 8px; font-size: 0.8em; color: #333; }
+    .aisle { width: 18px; }
+    .tooltip {
+      visibility: hidden;
+      background: #222;
+      color: #fff;
+      text-align: center;
+      border-radius: 4px;
+      padding: 2px 8px;
+      position: absolute;
+      z-index: 10;
+      bottom: 120%;
+      left: 50%;
+      transform: translateX(-50%);
+      font-size: 16px;
+      white-space: nowrap;
+      opacity: 0;
+      transition: opacity 0.2s;
+      pointer-events: none;
+    }
+    .seat-box:hover .tooltip {
+      visibility: visible;
+      opacity: 1;
+    }
+    .tooltip-below {
+      bottom: auto !important;
+      top: 120%;
+    }
+    </style>
+"""
+
+def day_seat_status(event, registry, seat_index, day, rules=None):
+    # Compile the blocking rules for this day once; both the map and the summary read this array
+    if rules is None:
+        rules = load_seat_rules(event['rules'])
+    layout = registry['layout']
+    with stage('day_seat_status', seats=len(layout)):
+        return seat_status(compile_seat_rules(rules, layout, day), layout, seat_index[day][1], rules['colors'])
+
+def build_seat_map_html(registry, seat_index, day, status_df):
+    names, occupied = seat_index[day]
+    seat_labels = registry['layout']['seat'].to_numpy()
+    status = status_df['status'].to_numpy()
+    color = status_df['color'].to_numpy()
+    def seat_box(seat_id, row_label, tooltip_class):
+        seat = seat_labels[seat_id]
+        if occupied[seat_id]:
+            tooltip_text = f"Row {row_label}, Seat {seat} — Name(s): {names[seat_id]}"
+        elif status[seat_id] == STATUS_BLOCKED:
+            tooltip_text = f"Row {row_label}, Seat {seat} — Blocked"
+        else:
+            tooltip_text = f"Row {row_label}, Seat {seat} — Available"
+        return f'<div class="seat-box" style="background:{color[seat_id]};"><span class="tooltip {tooltip_class}">{tooltip_text}</span></div>'
+    seat_map_html = SEAT_MAP_CSS + '<div id="seatmap-outer">'
+    for idx, (row_label, left_ids, center_ids, right_ids) in enumerate(registry['display_rows']):
+        seat_map_html += '<div class="seat-row">'
+        tooltip_class = 'tooltip-below' if idx == 0 else ''
+        # Left side seats
+        for seat_id in left_ids:
+            seat_map_html += seat_box(seat_id, row_label, tooltip_class)
+        if len(left_ids) and len(center_ids):
+            seat_map_html += '<div class="aisle"></div>'
+        for seat_id in center_ids:
+            seat_map_html += seat_box(seat_id, row_label, tooltip_class)
+        if len(right_ids) and len(center_ids):
+            seat_map_html += '<div class="aisle"></div>'
+        for seat_id in right_ids:
+            seat_map_html += seat_box(seat_id, row_label, tooltip_class)
+        seat_map_html += f'<span class="seat-label" title="Row {row_label}">{row_label}</span>'
+        seat_map_html += '</div>'
+        if row_label in SEAT_MAP_ROW_GAPS:
+            seat_map_html += '<div style="height:12px;"></div>'
+    seat_map_html += '</div>'
+    return seat_map_html
+
+def seat_map_layout(registry):
+    # Static part of the client-side seat map: sent once per venue map, versioned by its content
+    layout = {
+        'labels': registry['layout']['seat'].tolist(),
+        'rows': [[label, left.tolist(), center.tolist(), right.tolist()]
+                 for label, left, center, right in registry['display_rows']],
+        'gaps': SEAT_MAP_ROW_GAPS,
+    }
+    layout['version'] = hashlib.sha256(json.dumps(layout, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+    return layout
+
+def seat_map_day_payload(seat_index, day, status_df):
+    # Per-day part: a palette plus one color index and status per seat id, and names for booked seats only
+    with stage('seat_map_day_payload', seats=len(status_df)):
+        names, occupied = seat_index[day]
+        palette, color = np.unique(status_df['color'].to_numpy().astype(str), return_inverse=True)
+        booked = np.flatnonzero(occupied)
+        return {
+            'day': day,
+            'palette': palette.tolist(),
+            'color': color.tolist(),
+            'status': status_df['status'].tolist(),
+            'booked': booked.tolist(),
+            'names': names[booked].tolist(),
+        }
+
+def gallery_summary(status_df, galleries):
+    # Count seats by status per gallery, straight from the compiled status array
+    counts = (pd.crosstab(status_df['gallery'], status_df['status'])
+              .reindex(index=list(galleries), columns=[STATUS_BOOKED, STATUS_BLOCKED, STATUS_AVAILABLE], fill_value=0))
+    return {
+        'Gallery': list(galleries.keys()),
+        'Booked (Green)': counts[STATUS_BOOKED].tolist(),
+        'Blocked (Orange/Red)': counts[STATUS_BLOCKED].tolist(),
+        'Available': counts[STATUS_AVAILABLE].tolist(),
+    }
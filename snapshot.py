@@ -0,0 +1,76 @@
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from seating import (
+    day_seat_status, gallery_summary, load_seat_rules, seat_map_day_payload, unallocated_names, unmapped_seats,
+)
+from timing import stage
+
+def freeze(value):
+    # Marks every NumPy array reachable through dicts, lists and tuples read-only. DataFrames cannot be
+    # locked this way; sessions treat them as read-only by convention.
+    if isinstance(value, np.ndarray):
+        value.setflags(write=False)
+    elif isinstance(value, dict):
+        for item in value.values():
+            freeze(item)
+    elif isinstance(value, (list, tuple)):
+        for item in value:
+            freeze(item)
+    return value
+
+def build_snapshot(event, version, table, day_seats, registry, layout, revenue, rules=None):
+    # Everything a dashboard rerun reads for one data version: the seat table with its per-day index and
+    # style matrix, and per day the bookings, unallocated names, seat status, gallery summary and seat map
+    # payload. Built once per version and shared by every session, so none of it may be modified.
+    with stage('build_snapshot', seats=registry['size']):
+        if rules is None:
+            rules = load_seat_rules(event['rules'])
+        seat_index = table[4]
+        days = {}
+        for day in event['days']:
+            status_df = day_seat_status(event, registry, seat_index, day, rules)
+            days[day] = {
+                'seats': day_seats[day],
+                'unallocated': unallocated_names(day_seats[day]),
+                'galleries': gallery_summary(status_df, event['galleries']),
+                'payload': seat_map_day_payload(seat_index, day, status_df),
+            }
+        return freeze({
+            'version': version,
+            'event': event,
+            'table': table,
+            'registry': registry,
+            'layout': layout,
+            'days': days,
+            'unmapped': unmapped_seats(pd.concat(day_seats.values(), ignore_index=True), registry),
+            'revenue': revenue,
+            'built': time.time(),
+        })
+
+def new_store():
+    # Holder for one event's current snapshot. Readers only read store['snapshot']; a builder swaps in a
+    # whole new snapshot with one assignment, so readers never see a half-built one and never lock.
+    return {'snapshot': None, 'lock': threading.Lock(), 'builds': 0}
+
+def current_snapshot(store, version, build):
+    # The snapshot for version, building it (once, whichever session asks first) when it is not there yet.
+    # While one thread builds, the others keep serving the previous version instead of waiting; they only
+    # block when there is no snapshot at all.
+    snapshot = store['snapshot']
+    if snapshot is not None and snapshot['version'] == version:
+        return snapshot
+    if not store['lock'].acquire(blocking=snapshot is None):
+        return snapshot
+    try:
+        snapshot = store['snapshot']
+        if snapshot is None or snapshot['version'] != version:
+            snapshot = build()
+            store['snapshot'] = snapshot
+            store['builds'] += 1
+        return snapshot
+    finally:
+        store['lock'].release()
@@ -0,0 +1,84 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from allocate import (
+    allocate_parties, allocate_party, build_free_index, day_free_seats, free_runs, seat_segments,
+)
+from seating import (
+    build_seat_registry, explode_seats, generate_master_seat_map, load_event, load_seat_rules, read_export,
+    seat_ids, tag_bookings,
+)
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
+
+@pytest.fixture(scope='module')
+def event():
+    event = load_event(DATA_DIR)
+    registry = build_seat_registry(generate_master_seat_map(event['seat_map']), event['galleries'])
+    seats = pd.concat([explode_seats(tag_bookings(event, key, read_export(source['path'])))
+                       for key, source in event['sources'].items()], ignore_index=True)
+    return event, registry, seats, load_seat_rules(event['rules'])
+
+def scan_first_fit(segments, free, count, gallery_order):
+    # The allocator's rule without its index: the first gallery in order, front segment first, with a free
+    # run of count seats; the run's first seats are taken
+    for gallery in gallery_order:
+        for segment_gallery, _, ids in segments:
+            if segment_gallery != gallery:
+                continue
+            for start, length in free_runs(free[ids]):
+                if length >= count:
+                    taken = ids[start:start + count]
+                    free[taken] = False
+                    return taken
+    return None
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_index_matches_scan(event, seed):
+    # Random occupancy and party sizes until the venue is full; the max-tree index must pick the seats a
+    # plain scan picks, party after party
+    event, registry, _, _ = event
+    rng = np.random.default_rng(seed)
+    segments = seat_segments(registry)
+    order = list(event['galleries'])
+    rng.shuffle(order)
+    free = rng.random(registry['size']) < 0.6
+    index = build_free_index(segments, free.copy(), order)
+    for count in rng.integers(1, 9, 400):
+        expected = scan_first_fit(segments, free, count, order)
+        ids = allocate_party(index, count, order)
+        if expected is None:
+            assert ids is None
+        else:
+            np.testing.assert_array_equal(ids, expected)
+
+def test_proposals_are_free_and_adjacent(event):
+    event, registry, seats, rules = event
+    days = list(event['days'])
+    parties = [{'Confirmation': f'TALLOC{i:04d}', 'Source': 'test', 'First Name': 'Guest', 'Last Name': str(i),
+                'Ticket Count': int(count), 'days': tuple(days[i % 3:] if i % 4 else days[1:2])}
+               for i, count in enumerate(np.random.default_rng(0).integers(1, 7, 150))]
+    proposals = allocate_parties(event, parties, seats=seats, registry=registry, rules=rules)
+    assert len(proposals) == len(parties)
+    placed = proposals[proposals['Status'] == 'proposed']
+    assert len(placed) > 0
+
+    free = day_free_seats(event, registry, seats, rules)
+    segment_of = np.full(registry['size'], -1)
+    for i, (_, _, ids) in enumerate(seat_segments(registry)):
+        segment_of[ids] = i
+    taken = {day: np.zeros(registry['size'], dtype=bool) for day in days}
+    for _, proposal in placed.iterrows():
+        ids = seat_ids(registry, pd.Series(proposal['Seats'].split(', ')))
+        assert len(ids) == proposal['Ticket Count'] and (ids >= 0).all()
+        # One run of neighbouring seats in one section of one row
+        assert len(set(segment_of[ids])) == 1
+        segment = seat_segments(registry)[segment_of[ids[0]]][2]
+        positions = np.flatnonzero(np.isin(segment, ids))
+        assert positions[-1] - positions[0] == len(ids) - 1
+        for day in proposal['Days'].split(', '):
+            assert free[day][ids].all() and not taken[day][ids].any()
+            taken[day][ids] = True
@@ -0,0 +1,73 @@
+import contextlib
+import csv
+import json
+import os
+import shutil
+import threading
+import urllib.error
+import urllib.request
+
+import pytest
+
+from checkin import CHECKIN_LOG, build_checkin_index, load_checkin_log, lookup, serve
+from seating import load_event
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
+
+@pytest.fixture
+def event_dir(tmp_path):
+    path = tmp_path / 'event'
+    shutil.copytree(DATA_DIR, path, ignore=shutil.ignore_patterns('.snapshots', 'checkins.jsonl'))
+    return str(path)
+
+@contextlib.contextmanager
+def running(event_dir):
+    # The check-in service on a free local port, in a background thread
+    server = serve(event_dir, port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
+
+@pytest.fixture
+def server(event_dir):
+    with running(event_dir) as server:
+        yield server
+
+def post(server, path, body):
+    # (status, decoded JSON) for a POST of raw bytes
+    request = urllib.request.Request(f'http://127.0.0.1:{server.server_port}{path}', data=body)
+    try:
+        with urllib.request.urlopen(request) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read())
+
+@pytest.mark.parametrize('body', [b'[]', b'["T3D4153DB7"]', b'"T3D4153DB7"', b'null', b'7'])
+def test_checkin_body_must_be_an_object(server, body):
+    assert post(server, '/checkin', body) == (400, {'error': 'body must be a JSON object'})
+
+@pytest.mark.parametrize('confirmation', [None, '', ' ', 12345, ['T3D4153DB7']])
+def test_checkin_needs_a_confirmation_string(server, confirmation):
+    status, body = post(server, '/checkin', json.dumps({'confirmation': confirmation, 'day': '2025-07-26'}).encode())
+    assert status == 400
+
+def test_checkin_marks_every_record_of_the_booking(event_dir):
+    # The same confirmation in the 26th's export and in the two-day pass export: both records are checked in,
+    # and both again when the log is replayed
+    with open(os.path.join(event_dir, '26.csv'), encoding='utf-8-sig', newline='') as f:
+        row = next(csv.DictReader(f))
+    with open(os.path.join(event_dir, '2 days.csv'), 'a', encoding='utf-8', newline='') as f:
+        csv.writer(f).writerow(row.values())
+    with running(event_dir) as server:
+        status, body = post(server, '/checkin', json.dumps({'confirmation': row['Confirmation'].lower(),
+                                                            'day': '2025-07-26'}).encode())
+    assert status == 200
+    assert [(r['source'], r['checked_in']) for r in body['matches']] == [('26', True), ('2days', True)]
+
+    index = build_checkin_index(load_event(event_dir))
+    assert load_checkin_log(index, os.path.join(event_dir, CHECKIN_LOG)) == 1
+    records = lookup(index, '2025-07-26', confirmation=row['Confirmation'])
+    assert len(records) == 2 and all(r['checked_in'] for r in records)
@@ -0,0 +1,98 @@
+import pandas as pd
+
+from seating import PATRON_BLOCK_LIMIT, full_names, name_keys, resolve_patrons
+from timing import finish_run, start_run
+
+def bookings(*rows):
+    # (first name, last name, email, phone) per booking; confirmations are B0, B1, ...
+    df = pd.DataFrame(rows, columns=['First Name', 'Last Name', 'Email', 'Phone'])
+    df.insert(0, 'Confirmation', [f'B{i}' for i in range(len(df))])
+    df['__key'] = name_keys(full_names(df))
+    return df
+
+def patrons_of(*rows):
+    return resolve_patrons(bookings(*rows)).to_dict()
+
+def test_same_name_and_contact_variants_merge():
+    patrons = patrons_of(
+        ('Chandrakant ', 'Patel', 'cpatel@gmail.com', None),
+        ('Patel', 'Chandrakant', 'C.Patel@Gmail.com', '(209) 608-1154'),
+        ('Chandrakant', 'Patel Family', None, '12096081154'),
+    )
+    assert set(patrons.values()) == {'chandrakant patel'}
+
+def test_conflicting_contacts_block_a_merge():
+    patrons = patrons_of(
+        ('Chandrakant', 'Patel', 'cpatel@gmail.com', '2096081154'),
+        ('Chandrakant', 'Patel', 'chandrakant.p@yahoo.com', '4085550199'),
+        # Fits either of them, so it joins one
+        ('Chandrakant', 'Patel', None, None),
+    )
+    assert {patrons['B0'], patrons['B1']} == {'chandrakant patel', 'chandrakant patel #2'}
+    assert patrons['B2'] in (patrons['B0'], patrons['B1'])
+
+def test_contacts_conflict_with_the_whole_patron():
+    # B2 has no email, but its phone differs from the patron B0 + B1 already has
+    patrons = patrons_of(
+        ('Ishaan', 'Vartak', 'ivartak@example.com', None),
+        ('Ishaan Yash', 'Vartak', 'ivartak@example.com', '5550002222'),
+        ('Ishaan', 'Vartak', None, '5550001111'),
+    )
+    assert patrons['B0'] == patrons['B1'] != patrons['B2']
+
+def test_patron_id_is_the_smallest_name_key():
+    patrons = patrons_of(
+        ('Amit Vasant', 'Jadhav', 'ajadhav@example.com', None),
+        ('Amit', 'Jadhav', 'ajadhav@example.com', None),
+    )
+    assert set(patrons.values()) == {'amit jadhav'}
+
+def test_phonetic_variants_merge_without_contacts():
+    patrons = patrons_of(
+        ('Kavita', 'Patel', 'kavita@example.com', None),
+        ('Kavita', 'Pattel', None, None),
+        ('Kavitta', 'Patel', None, None),
+    )
+    assert set(patrons.values()) == {'kavita patel'}
+
+def test_phonetic_variants_with_conflicting_contacts_stay_apart():
+    patrons = patrons_of(
+        ('Kavita', 'Patel', 'kavita@example.com', None),
+        ('Kavita', 'Pattel', 'kpattel@example.com', None),
+    )
+    assert patrons['B0'] != patrons['B1']
+
+def test_title_words_are_kept():
+    patrons = patrons_of(
+        ('Mr', 'Paranjape', None, None),
+        ('Mrs', 'Paranjape', None, None),
+        ('Paranjape', 'Family', None, None),
+    )
+    assert len(set(patrons.values())) == 3
+
+def test_blank_names_link_nothing_by_name():
+    patrons = patrons_of(
+        (None, None, 'first@example.com', None),
+        (None, None, None, '5550001111'),
+        (None, None, None, None),
+        ('Guest', None, 'guest@example.com', None),
+        ('Guest', None, None, None),
+        # The same email still makes the same buyer
+        (None, None, 'First@Example.com', None),
+    )
+    assert patrons['B0'] == patrons['B5']
+    assert len({patrons[f'B{i}'] for i in range(5)}) == 5
+
+def test_large_same_name_group_stays_linear():
+    # Thousands of different people under one name: each identity is tried against a bounded number of
+    # patrons, not against every earlier identity
+    n = 4000
+    df = bookings(*[('Asha', 'Patel', f'asha{i}@example.com', f'{5550000000 + i}') for i in range(n)])
+    run = start_run('test')
+    try:
+        patrons = resolve_patrons(df)
+    finally:
+        run = finish_run(run, log_path=None)
+    stage = next(s for s in run['stages'] if s['stage'] == 'resolve_patrons')
+    assert patrons.nunique() == n
+    assert stage['key_comparisons'] <= n * PATRON_BLOCK_LIMIT
@@ -0,0 +1,35 @@
+import os
+import shutil
+
+import pandas as pd
+import pytest
+
+from revenue import merge_cubes, money_values, revenue_cube
+from seating import build_seat_registry, generate_master_seat_map, load_bookings, load_event
+from test_watch import DATA_DIR, csv_text, edit, read_rows
+
+def event_revenue(event_dir):
+    event = load_event(event_dir)
+    bookings = load_bookings(event)
+    registry = build_seat_registry(generate_master_seat_map(event['seat_map']), event['galleries'])
+    return merge_cubes([revenue_cube(event, key, bookings[bookings['__source'] == key], registry)
+                        for key in event['sources']])
+
+def test_money_values():
+    values = pd.Series(['1,200.00', '$99', ' 12.5 ', '', None, 'n/a'], dtype='string')
+    parsed = money_values(values)
+    assert parsed[:3].tolist() == [1200.0, 99.0, 12.5]
+    assert parsed[3:].isna().all()
+
+def test_formatted_money_only_reaches_revenue(tmp_path):
+    # A '1,200.00' in an export must not stop the seat pipeline from loading it
+    event_dir = str(tmp_path / 'event')
+    shutil.copytree(DATA_DIR, event_dir, ignore=shutil.ignore_patterns('.snapshots', 'checkins.jsonl'))
+    before = event_revenue(event_dir)['total'].sum()
+    path = os.path.join(event_dir, '26.csv')
+    header, rows = read_rows(path)
+    old = float(rows[0][header.index('Total')] or 0)
+    rows[0] = edit(rows[0], header, Total='1,200.00')
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        f.write(csv_text([header] + rows))
+    assert event_revenue(event_dir)['total'].sum() == pytest.approx(before - old + 1200)
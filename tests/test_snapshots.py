@@ -0,0 +1,42 @@
+import os
+import shutil
+
+import pandas as pd
+import pytest
+
+from seating import SNAPSHOT_DIR, read_export, read_export_csv, snapshot_path
+
+pytest.importorskip('pyarrow')
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
+
+@pytest.fixture
+def export(tmp_path):
+    path = tmp_path / '26.csv'
+    shutil.copy(os.path.join(DATA_DIR, '26.csv'), path)
+    return str(path)
+
+def assert_same_as_csv(df, path):
+    pd.testing.assert_frame_equal(df.astype(object), read_export_csv(path).astype(object))
+
+def test_other_writers_temporary_files_are_kept(export):
+    folder = os.path.join(os.path.dirname(export), SNAPSHOT_DIR)
+    os.makedirs(folder)
+    stale = os.path.join(folder, '26.csv.1-2.abcdef01.arrow')
+    pending = os.path.join(folder, '26.csv.1-2.abcdef01.arrow.x1y2z3.tmp')
+    for name in (stale, pending):
+        open(name, 'w').close()
+    assert_same_as_csv(read_export(export), export)
+    assert os.path.exists(snapshot_path(export)) and os.path.exists(pending) and not os.path.exists(stale)
+    assert sorted(os.listdir(folder)) == sorted([os.path.basename(snapshot_path(export)), os.path.basename(pending)])
+
+def test_torn_snapshot_falls_back_to_the_csv(export):
+    read_export(export)
+    snapshot = snapshot_path(export)
+    with open(snapshot, 'r+b') as f:
+        f.truncate(os.path.getsize(snapshot) // 2)
+    assert_same_as_csv(read_export(export), export)
+    # The torn snapshot is dropped, so the next read writes a whole one again
+    assert not os.path.exists(snapshot)
+    read_export(export)
+    assert_same_as_csv(read_export(export), export)
@@ -0,0 +1,192 @@
+import csv
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from revenue import CUBE_KEYS
+from timing import finish_run, start_run
+from watch import build_live_state, poll
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
+
+@pytest.fixture
+def event_dir(tmp_path):
+    path = tmp_path / 'event'
+    shutil.copytree(DATA_DIR, path, ignore=shutil.ignore_patterns('.snapshots', 'checkins.jsonl'))
+    return str(path)
+
+def read_rows(path):
+    with open(path, encoding='utf-8-sig', newline='') as f:
+        rows = list(csv.reader(f))
+    return rows[0], rows[1:]
+
+def csv_text(rows):
+    return ''.join(','.join(f'"{v}"' if ',' in v else v for v in row) + '\n' for row in rows)
+
+def touch(path):
+    # A later mtime even when the filesystem clock has not moved on since the last write
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+def edit(row, header, **values):
+    row = list(row)
+    for column, value in values.items():
+        row[header.index(column.replace('_', ' '))] = value
+    return row
+
+def assert_same(live, full):
+    if isinstance(full, pd.DataFrame):
+        pd.testing.assert_frame_equal(live, full)
+    elif isinstance(full, np.ndarray):
+        np.testing.assert_array_equal(live, full)
+    elif isinstance(full, dict):
+        assert live.keys() == full.keys()
+        for key in full:
+            assert_same(live[key], full[key])
+    elif isinstance(full, (tuple, list)):
+        assert len(live) == len(full)
+        for a, b in zip(live, full):
+            assert_same(a, b)
+    else:
+        assert live == full
+
+def sorted_cube(cube):
+    return cube.sort_values(CUBE_KEYS).reset_index(drop=True)
+
+def assert_matches_rebuild(state):
+    # The incrementally updated state against one built from scratch over the same files
+    full = build_live_state(state['event']['dir'])
+    assert_same(state['table'], full['table'])
+    pd.testing.assert_series_equal(state['patrons'].sort_index(), full['patrons'].sort_index())
+    pd.testing.assert_frame_equal(sorted_cube(state['revenue']), sorted_cube(full['revenue']), check_exact=False)
+
+def poll_run(state):
+    # poll() under a timing run, so tests can see how many bookings each stage touched
+    run = start_run('test')
+    try:
+        changes = poll(state)
+    finally:
+        run = finish_run(run, log_path=None)
+    return changes, run['stages']
+
+def test_append(event_dir):
+    state = build_live_state(event_dir)
+    path = os.path.join(event_dir, '26.csv')
+    header, rows = read_rows(path)
+    appended = [
+        # Same patron as the first row, name entered the other way round, on a new seat
+        edit(rows[0], header, Confirmation='TAPPEND0001', First_Name='Patel', Last_Name='Chandrakant', Seats='Q102'),
+        # Someone new on a seat that is already sold
+        edit(rows[1], header, Confirmation='TAPPEND0002', First_Name='Neha', Last_Name='Gokhale',
+             Email='neha.gokhale@example.com', Phone='5550101234', Seats='G109'),
+    ]
+    with open(path, 'a', encoding='utf-8', newline='') as f:
+        f.write(csv_text(appended))
+    touch(path)
+
+    changes, stages = poll_run(state)
+    assert [(c['appended'], c['added'], c['changed'], c['removed']) for c in changes] == [(True, 2, 0, 0)]
+    assert 'G109' in state['table'][1]['2025-07-26']
+    # Patrons are re-resolved for the linked bookings only, not for every export
+    resolved = next(s for s in stages if s['stage'] == 'resolve_patrons')
+    assert resolved['rows'] < sum(len(b) for b in state['bookings'].values())
+    assert_matches_rebuild(state)
+
+def test_append_reaches_linked_patrons(event_dir):
+    # A new booking can change the patron of one it shares nothing with. Ishaan Vartak (email, no phone)
+    # and a box-office Ishaan Vartak (phone only) are one patron until 'Ishaan Yash Vartak' books with the
+    # first one's email and another phone: the two phones then say they are different people.
+    path = os.path.join(event_dir, '25.csv')
+    header, rows = read_rows(path)
+    rows += [
+        edit(rows[0], header, Confirmation='TVARTAK001', First_Name='Ishaan', Last_Name='Vartak',
+             Email='ivartak@example.com', Phone='', Seats='E15'),
+        edit(rows[0], header, Confirmation='TVARTAK002', First_Name='Ishaan', Last_Name='Vartak', Email='',
+             Phone='5550001111', Seats='E17'),
+    ]
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        f.write(csv_text([header] + rows))
+    state = build_live_state(event_dir)
+    assert state['patrons']['TVARTAK001'] == state['patrons']['TVARTAK002']
+
+    path = os.path.join(event_dir, '26.csv')
+    header, rows = read_rows(path)
+    with open(path, 'a', encoding='utf-8', newline='') as f:
+        f.write(csv_text([edit(rows[0], header, Confirmation='TVARTAK003', First_Name='Ishaan Yash', Last_Name='Vartak',
+                               Email='ivartak@example.com', Phone='5550002222', Seats='Q105')]))
+    touch(path)
+
+    poll(state)
+    assert state['patrons']['TVARTAK001'] == state['patrons']['TVARTAK003']
+    assert state['patrons']['TVARTAK001'] != state['patrons']['TVARTAK002']
+    assert_matches_rebuild(state)
+
+def test_rewrite(event_dir):
+    state = build_live_state(event_dir)
+    path = os.path.join(event_dir, '25.csv')
+    header, rows = read_rows(path)
+    rows = rows[1:]  # cancelled
+    rows[0] = edit(rows[0], header, Seats='J109')  # moved
+    rows[1] = edit(rows[1], header, First_Name='Sunil', Last_Name='Dandekar Family')  # renamed
+    rows.reverse()
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        f.write(csv_text([header] + rows))
+    touch(path)
+
+    changes = poll(state)
+    assert [(c['appended'], c['added'], c['changed'], c['removed']) for c in changes] == [(False, 0, 2, 1)]
+    assert_matches_rebuild(state)
+
+def test_replace_by_rename(event_dir):
+    # Exporters that write a temporary file and rename it over the old export
+    state = build_live_state(event_dir)
+    path = os.path.join(event_dir, '2 days.csv')
+    header, rows = read_rows(path)
+    rows = rows[:-1] + [edit(rows[0], header, Confirmation='TRENAME0001', First_Name='Sachin', Last_Name='Khedekar',
+                             Seats='B107')]
+    with open(path + '.part', 'w', encoding='utf-8', newline='') as f:
+        f.write(csv_text([header] + rows))
+    os.replace(path + '.part', path)
+    touch(path)
+
+    changes = poll(state)
+    assert [(c['added'], c['removed']) for c in changes] == [(1, 1)]
+    assert_matches_rebuild(state)
+
+def test_renamed_export_rebuilds(event_dir):
+    # An export renamed in the manifest is a different source: the whole state is rebuilt
+    state = build_live_state(event_dir)
+    os.rename(os.path.join(event_dir, '27.csv'), os.path.join(event_dir, '27 final.csv'))
+    manifest_path = os.path.join(event_dir, 'event.json')
+    with open(manifest_path, encoding='utf-8') as f:
+        manifest = json.load(f)
+    next(s for s in manifest['sources'] if s['key'] == '27')['file'] = '27 final.csv'
+    with open(manifest_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    touch(manifest_path)
+
+    changes = poll(state)
+    assert [c.get('rebuilt') for c in changes] == [True]
+    assert_matches_rebuild(state)
+
+def test_successive_changes(event_dir):
+    # Deltas applied on top of deltas still match a rebuild
+    state = build_live_state(event_dir)
+    path = os.path.join(event_dir, '26.csv')
+    header, rows = read_rows(path)
+    for i, seat in enumerate(['Q103', 'Q104', 'F106']):
+        rows.append(edit(rows[i], header, Confirmation=f'TNEXT{i:05d}', Seats=seat))
+        with open(path, 'w', encoding='utf-8', newline='') as f:
+            f.write(csv_text([header] + rows))
+        touch(path)
+        assert len(poll(state)) == 1
+    rows = rows[2:]
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        f.write(csv_text([header] + rows))
+    touch(path)
+    poll(state)
+    assert_matches_rebuild(state)
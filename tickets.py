@@ -0,0 +1,267 @@
+import argparse
+import os
+import tempfile
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from report import event_slug
+from revenue import NO_GALLERY, UNKNOWN_SEAT
+from seating import (
+    DATA_DIR, build_seat_registry, explode_seats, generate_master_seat_map, load_bookings, load_event,
+    resolve_patrons, seat_ids,
+)
+from timing import stage
+
+# Door lists and ticket stubs are written under this directory, one sub-directory per event
+TICKETS_DIR = 'tickets'
+# US Letter in points. Text uses the PDF base fonts, so nothing has to be embedded.
+PAGE_WIDTH, PAGE_HEIGHT, PAGE_MARGIN = 612, 792, 40
+PDF_FONTS = {'F1': 'Helvetica', 'F2': 'Helvetica-Bold'}
+DOOR_LIST_ROWS = 48
+# Door list columns: (heading, x position, characters kept)
+DOOR_LIST_COLUMNS = [('Seat', 58, 8), ('Name', 120, 42), ('Confirmation', 390, 14), ('Source', 490, 12)]
+STUB_COLUMNS, STUB_ROWS = 2, 5
+# Stubs per print task; tasks are cut at patron boundaries so a patron's stubs stay together
+STUB_TASK_SIZE = 2000
+
+# --- Minimal streaming PDF writer: pages go to disk as they are drawn, only their offsets are kept ---
+
+def pdf_text(value):
+    # PDF string literal in the base fonts' WinAnsi encoding; characters outside it print as '?'
+    raw = str(value).encode('cp1252', errors='replace').decode('latin-1')
+    return '(' + raw.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)') + ')'
+
+def text(x, y, value, size=9, font='F1'):
+    return f'BT /{font} {size} Tf {x:.1f} {y:.1f} Td {pdf_text(value)} Tj ET'
+
+def clip(value, width):
+    value = str(value)
+    return value if len(value) <= width else value[:width - 3] + '...'
+
+def open_pdf(path):
+    # Object 1 is the catalog, 2 the page tree, then one per font; page objects follow as pages are added
+    f = open(path, 'wb')
+    f.write(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+    return {'file': f, 'offsets': {}, 'pages': [], 'next_id': 3 + len(PDF_FONTS)}
+
+def write_object(pdf, obj_id, body):
+    pdf['offsets'][obj_id] = pdf['file'].tell()
+    pdf['file'].write(b'%d 0 obj\n' % obj_id + body + b'\nendobj\n')
+
+def add_page(pdf, ops):
+    # One page from a list of content stream operators, written straight to the file
+    content = zlib.compress('\n'.join(ops).encode('latin-1'))
+    content_id, page_id = pdf['next_id'], pdf['next_id'] + 1
+    pdf['next_id'] += 2
+    write_object(pdf, content_id, b'<< /Length %d /Filter /FlateDecode >>\nstream\n' % len(content)
+                 + content + b'\nendstream')
+    fonts = ' '.join(f'/{name} {3 + i} 0 R' for i, name in enumerate(PDF_FONTS))
+    write_object(pdf, page_id, (f'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {PAGE_WIDTH} {PAGE_HEIGHT}] '
+                                f'/Resources << /Font << {fonts} >> >> /Contents {content_id} 0 R >>').encode())
+    pdf['pages'].append(page_id)
+
+def close_pdf(pdf):
+    # Fonts, page tree, catalog and cross-reference table go last, once every page is on disk
+    for i, font in enumerate(PDF_FONTS.values()):
+        write_object(pdf, 3 + i, f'<< /Type /Font /Subtype /Type1 /BaseFont /{font} '
+                                 f'/Encoding /WinAnsiEncoding >>'.encode())
+    kids = ' '.join(f'{page} 0 R' for page in pdf['pages'])
+    write_object(pdf, 2, f"<< /Type /Pages /Kids [{kids}] /Count {len(pdf['pages'])} >>".encode())
+    write_object(pdf, 1, b'<< /Type /Catalog /Pages 2 0 R >>')
+    f, size = pdf['file'], pdf['next_id']
+    xref = f.tell()
+    f.write(b'xref\n0 %d\n0000000000 65535 f \n' % size)
+    f.write(b''.join(b'%010d 00000 n \n' % pdf['offsets'][obj_id] for obj_id in range(1, size)))
+    f.write(b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (size, xref))
+    f.close()
+    return len(pdf['pages'])
+
+# --- Page layouts ---
+
+def door_list_pages(title, heading, rows):
+    # A check box, seat, name, confirmation and source per line; an empty section still gets one page
+    pages = max(1, -(-len(rows) // DOOR_LIST_ROWS))
+    for page in range(pages):
+        top = PAGE_HEIGHT - PAGE_MARGIN
+        ops = ['0.5 w', text(PAGE_MARGIN, top, title, 12, 'F2'),
+               text(PAGE_MARGIN, top - 16, f'{heading} - page {page + 1} of {pages}', 10)]
+        y = top - 44
+        ops += [text(x, y, name, 9, 'F2') for name, x, _ in DOOR_LIST_COLUMNS]
+        for row in rows[page * DOOR_LIST_ROWS:(page + 1) * DOOR_LIST_ROWS]:
+            y -= 14
+            ops.append(f'{PAGE_MARGIN} {y - 1:.1f} 9 9 re S')
+            ops += [text(x, y, clip(value, width)) for (_, x, width), value in zip(DOOR_LIST_COLUMNS, row)]
+        yield ops
+
+def stub_pages(title, stubs):
+    # STUB_COLUMNS x STUB_ROWS stubs to a page, each in a dashed cut box
+    per_page = STUB_COLUMNS * STUB_ROWS
+    width = (PAGE_WIDTH - 2 * PAGE_MARGIN) / STUB_COLUMNS
+    height = (PAGE_HEIGHT - 2 * PAGE_MARGIN) / STUB_ROWS
+    for start in range(0, len(stubs), per_page):
+        ops = ['[4 3] 0 d 0.5 w']
+        for i, (day, seat, gallery, row_label, name, confirmation) in enumerate(stubs[start:start + per_page]):
+            x = PAGE_MARGIN + (i % STUB_COLUMNS) * width
+            y = PAGE_HEIGHT - PAGE_MARGIN - (i // STUB_COLUMNS + 1) * height
+            top = y + height - 22
+            ops += [f'{x:.1f} {y:.1f} {width:.1f} {height:.1f} re S',
+                    text(x + 12, top, clip(title, 46), 10, 'F2'),
+                    text(x + 12, top - 16, day, 10),
+                    text(x + 12, top - 48, seat, 28, 'F2'),
+                    text(x + 12, top - 66, f'{gallery} - row {row_label}' if row_label else gallery, 9),
+                    text(x + 12, top - 90, clip(name, 44), 10),
+                    text(x + 12, top - 104, f'Confirmation {confirmation}', 8)]
+        yield ops
+
+def write_part(task):
+    # One print task (a door list section or a run of stubs) streamed to its own PDF; runs in a worker
+    pdf = open_pdf(task['path'])
+    if task['kind'] == 'door list':
+        pages = door_list_pages(task['title'], task['heading'], task['rows'])
+    else:
+        pages = stub_pages(task['title'], task['rows'])
+    for ops in pages:
+        add_page(pdf, ops)
+    return close_pdf(pdf)
+
+# --- Print jobs ---
+
+def ticket_seats(event, bookings=None, registry=None, patrons=None):
+    # The seat frame plus each seat's gallery, row, patron and venue map position (unmapped seats last)
+    if bookings is None:
+        bookings = load_bookings(event)
+    if registry is None:
+        registry = build_seat_registry(generate_master_seat_map(event['seat_map']), event['galleries'])
+    if patrons is None:
+        patrons = resolve_patrons(bookings)
+    seats = explode_seats(bookings)
+    ids = seat_ids(registry, seats['seat'])
+    known, position = ids >= 0, np.maximum(ids, 0)
+    layout = registry['layout']
+    return seats.assign(
+        order=np.where(known, ids, registry['size']),
+        gallery=np.where(known, layout['gallery'].fillna(NO_GALLERY).to_numpy()[position], UNKNOWN_SEAT),
+        row=np.where(known, layout['row'].to_numpy()[position], ''),
+        patron=seats['confirmation'].map(patrons).fillna(seats['key']),
+    )
+
+def task_rows(frame, columns):
+    return list(frame[columns].astype(object).fillna('').astype(str).itertuples(index=False, name=None))
+
+def print_tasks(event, seats, parts_dir):
+    # (output file, its tasks in page order). Each day's door list is split by gallery, with the unallocated
+    # bookings last; the stubs (grouped by patron, then day and seat) are split into runs of whole patrons.
+    outputs, count = [], 0
+
+    def task(kind, heading, rows):
+        nonlocal count
+        count += 1
+        return {'kind': kind, 'title': event['title'] if kind == 'door list' else event['name'],
+                'heading': heading, 'rows': rows, 'path': os.path.join(parts_dir, f'{count:05d}.pdf')}
+
+    allocated = seats[seats['seat'] != ''].sort_values(['order', 'seat'], kind='stable')
+    door_columns = ['seat', 'name', 'confirmation', 'source']
+    for day, label in event['days'].items():
+        day_seats = allocated[allocated['date'] == day]
+        tasks = [task('door list', f'{label} - {gallery}', task_rows(day_seats[day_seats['gallery'] == gallery],
+                                                                     door_columns))
+                 for gallery in list(event['galleries']) + [NO_GALLERY, UNKNOWN_SEAT]
+                 if (day_seats['gallery'] == gallery).any()]
+        unallocated = seats[(seats['date'] == day) & (seats['seat'] == '')]
+        tasks.append(task('door list', f'{label} - Unallocated', task_rows(unallocated, door_columns)))
+        outputs.append((f'door_list_{day}.pdf', tasks))
+
+    stubs = allocated.assign(day=allocated['date'].map(event['days'])).sort_values(
+        ['patron', 'date', 'order', 'seat'], kind='stable')
+    patrons = stubs['patron'].to_numpy()
+    starts = [0]
+    while starts[-1] + STUB_TASK_SIZE < len(stubs):
+        cut = starts[-1] + STUB_TASK_SIZE
+        while cut < len(stubs) and patrons[cut] == patrons[cut - 1]:
+            cut += 1
+        if cut == len(stubs):
+            break
+        starts.append(cut)
+    stub_columns = ['day', 'seat', 'gallery', 'row', 'name', 'confirmation']
+    outputs.append(('ticket_stubs.pdf', [task('stubs', None, task_rows(stubs.iloc[start:stop], stub_columns))
+                                         for start, stop in zip(starts, starts[1:] + [len(stubs)])]))
+    return outputs
+
+def read_xref(f):
+    # Offset of the cross-reference table and of objects 1..n in a PDF written by close_pdf
+    f.seek(0, os.SEEK_END)
+    f.seek(max(0, f.tell() - 64))
+    xref = int(f.read().rsplit(b'startxref', 1)[1].split()[0])
+    f.seek(xref)
+    f.readline()
+    count = int(f.readline().split()[1])
+    f.readline()  # object 0, the free list head
+    # Fixed 20-byte entries: 10-digit offset, generation, 'n'
+    return xref, [int(f.read(20)[:10]) for _ in range(1, count)]
+
+def append_part(pdf, path):
+    # Copies a part's pages into pdf one object at a time, renumbered after the pages already there. Parts
+    # share the output's page tree and font object numbers, so only /Contents needs rewriting.
+    with open(path, 'rb') as f:
+        xref, offsets = read_xref(f)
+        starts = sorted(offsets)
+        ends = dict(zip(starts, starts[1:] + [xref]))
+
+        def read_object(obj_id):
+            start = offsets[obj_id - 1]
+            f.seek(start)
+            chunk = f.read(ends[start] - start)
+            return chunk[chunk.index(b'\n') + 1:-len(b'\nendobj\n')]
+
+        # Pages were written as (content stream, page) pairs after the catalog, page tree and fonts
+        for content_id in range(3 + len(PDF_FONTS), len(offsets) + 1, 2):
+            new_id = pdf['next_id']
+            pdf['next_id'] += 2
+            write_object(pdf, new_id, read_object(content_id))
+            page = read_object(content_id + 1)
+            write_object(pdf, new_id + 1, page.replace(b'/Contents %d 0 R' % content_id, b'/Contents %d 0 R' % new_id))
+            pdf['pages'].append(new_id + 1)
+
+def merge_parts(parts, path):
+    # Parts concatenated in order into one PDF, streamed object by object
+    pdf = open_pdf(path)
+    for part in parts:
+        append_part(pdf, part)
+    return close_pdf(pdf)
+
+def write_tickets(event_dir, out_root, workers=None):
+    # Door lists (one PDF per day) and ticket stubs for one event. The parts are written in parallel, largest
+    # first, then concatenated in page order.
+    event = load_event(event_dir)
+    out_dir = os.path.join(out_root, event_slug(event))
+    os.makedirs(out_dir, exist_ok=True)
+    with stage('ticket_seats') as counters:
+        seats = ticket_seats(event)
+        counters['seats'] = len(seats)
+    with tempfile.TemporaryDirectory(dir=out_dir) as parts_dir:
+        outputs = print_tasks(event, seats, parts_dir)
+        tasks = sorted((t for _, ts in outputs for t in ts), key=lambda t: -len(t['rows']))
+        with stage('write_parts', tasks=len(tasks)):
+            if workers == 1 or len(tasks) == 1:
+                pages = list(map(write_part, tasks))
+            else:
+                with ProcessPoolExecutor(max_workers=workers) as pool:
+                    pages = list(pool.map(write_part, tasks))
+        with stage('merge_parts', pages=sum(pages)):
+            for name, ts in outputs:
+                merge_parts([t['path'] for t in ts], os.path.join(out_dir, name))
+    return event['name'], f'{sum(pages)} pages in {len(outputs)} PDFs written to {out_dir}'
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Write printable door lists and ticket stubs as PDFs.')
+    parser.add_argument('event_dir', nargs='?', default=DATA_DIR)
+    parser.add_argument('--out', default=TICKETS_DIR, help=f'output root; one sub-directory per event (default: {TICKETS_DIR})')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes (default: one per CPU)')
+    args = parser.parse_args(argv)
+    name, outcome = write_tickets(args.event_dir, args.out, args.workers)
+    print(f'{name}: {outcome}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+import contextvars
+import cProfile
+import io
+import json
+import os
+import pstats
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+# Stage timings of the current run are appended here, one JSON object per run
+TIMING_LOG = os.path.join('logs', 'stage_timings.jsonl')
+PROFILE_DIR = 'profiles'
+PROFILE_KINDS = ('cProfile', 'tracemalloc')
+# Lines of cProfile/tracemalloc output shown in the app
+PROFILE_TOP = 25
+
+# The run being recorded in this thread (each Streamlit session runs its script in its own thread).
+# Stages outside a run, e.g. in worker processes or report.py, cost one lookup and record nothing.
+_current_run = contextvars.ContextVar('current_run', default=None)
+
+def start_run(label):
+    run = {'label': label, 'started': time.time(), 'stages': [], '_depth': 0, '_t0': time.perf_counter()}
+    _current_run.set(run)
+    return run
+
+@contextmanager
+def stage(name, **counters):
+    # Times the block as one stage of the current run. Counters (rows, seats, ...) can be passed up
+    # front or set on the yielded dict once they are known.
+    run = _current_run.get()
+    entry = dict(counters)
+    if run is None:
+        yield entry
+        return
+    record = {'stage': name, 'depth': run['_depth']}
+    run['stages'].append(record)
+    run['_depth'] += 1
+    start = time.perf_counter()
+    try:
+        yield entry
+    finally:
+        record['seconds'] = time.perf_counter() - start
+        record.update(entry)
+        run['_depth'] -= 1
+
+def finish_run(run, log_path=TIMING_LOG):
+    # Closes the run and appends it to the JSONL log; a read-only checkout just skips the log
+    _current_run.set(None)
+    run['seconds'] = time.perf_counter() - run.pop('_t0')
+    run.pop('_depth')
+    if log_path:
+        try:
+            os.makedirs(os.path.dirname(log_path) or '.', exist_ok=True)
+            with open(log_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(run) + '\n')
+        except OSError:
+            pass
+    return run
+
+@contextmanager
+def capture_profile(kind, out_dir=PROFILE_DIR):
+    # cProfile or tracemalloc over the block. The yielded dict gets the saved file's path and a text
+    # summary of the top entries, to attach to an issue.
+    result = {'kind': kind}
+    stamp = time.strftime('%Y%m%d-%H%M%S')
+    os.makedirs(out_dir, exist_ok=True)
+    if kind == 'cProfile':
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield result
+        finally:
+            profiler.disable()
+            result['path'] = os.path.join(out_dir, f'rerun-{stamp}.prof')
+            profiler.dump_stats(result['path'])
+            text = io.StringIO()
+            pstats.Stats(profiler, stream=text).sort_stats('cumulative').print_stats(PROFILE_TOP)
+            result['summary'] = text.getvalue()
+    elif kind == 'tracemalloc':
+        tracemalloc.start(10)
+        try:
+            yield result
+        finally:
+            snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            result['path'] = os.path.join(out_dir, f'rerun-{stamp}.tracemalloc')
+            snapshot.dump(result['path'])
+            lines = [f'current {current / 2 ** 20:.1f} MB, peak {peak / 2 ** 20:.1f} MB']
+            lines += [str(s) for s in snapshot.statistics('lineno')[:PROFILE_TOP]]
+            result['summary'] = '\n'.join(lines)
+    else:
+        raise ValueError(f'Unknown profile kind {kind!r}; expected one of {PROFILE_KINDS}')
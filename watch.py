@@ -0,0 +1,272 @@
+import argparse
+import csv
+import hashlib
+import io
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from revenue import merge_cubes, revenue_cube
+from seating import (
+    EVENT_MANIFEST, INGEST_DTYPES, aggregate_days, build_seat_registry, combine_seat_table, explode_seats,
+    generate_master_seat_map, load_event, patch_day_aggregate, patron_cluster, patron_links, read_export,
+    resolve_patrons, seat_ids, seat_map_layout, tag_bookings, update_seat_table,
+)
+
+# Seconds between checks of the event's files
+WATCH_INTERVAL = 2.0
+
+def file_signature(path):
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns
+
+def read_export_state(path):
+    # Parsed export plus what the next poll needs to recognise a pure append: size, hash and header
+    with open(path, 'rb') as f:
+        data = f.read()
+    header = next(csv.reader(io.StringIO(data.split(b'\n', 1)[0].decode('utf-8-sig'))))
+    return {
+        'signature': file_signature(path),
+        'size': len(data),
+        'sha256': hashlib.sha256(data).hexdigest(),
+        'header': header,
+        'bookings': read_export(path),
+    }
+
+def build_live_state(event_dir):
+    # Everything the dashboard shows for one event, kept up to date by apply_source_change.
+    # Readers take state['lock'] and copy out state['table']; updates replace it rather than mutate it.
+    event = load_event(event_dir)
+    registry = build_seat_registry(generate_master_seat_map(event['seat_map']), event['galleries'])
+    exports = {key: read_export_state(source['path']) for key, source in event['sources'].items()}
+    bookings = {key: tag_bookings(event, key, exports[key]['bookings']) for key in event['sources']}
+    seats = pd.concat([explode_seats(bookings[key]) for key in event['sources']], ignore_index=True)
+    day_seats = {day: seats[seats['date'] == day].reset_index(drop=True) for day in event['days']}
+    day_aggs = aggregate_days(event, day_seats, registry)
+    patrons = resolve_patrons(pd.concat(bookings.values(), ignore_index=True))
+    revenue = merge_cubes([revenue_cube(event, key, bookings[key], registry) for key in event['sources']])
+    return {
+        'lock': threading.Lock(),
+        'event': event,
+        'registry': registry,
+        'seat_map_layout': seat_map_layout(registry),
+        'venue': {path: file_signature(path) for path in (os.path.join(event_dir, EVENT_MANIFEST), event['seat_map'])},
+        'exports': exports,
+        'bookings': bookings,
+        'patron_links': {key: patron_links(bookings[key]) for key in event['sources']},
+        'day_seats': day_seats,
+        'day_aggs': day_aggs,
+        'patrons': patrons,
+        'revenue': revenue,
+        'table': combine_seat_table(event, day_aggs, registry, patrons),
+        'version': 1,
+        'changes': [],
+        'error': None,
+    }
+
+def diff_bookings(old, new):
+    # Confirmations added, removed, or whose ingested columns changed between two parses of an export.
+    # Exports with missing or repeated confirmations cannot be keyed, so every row counts as changed.
+    old_keys, new_keys = old['Confirmation'], new['Confirmation']
+    if old_keys.isna().any() or new_keys.isna().any() or old_keys.duplicated().any() or new_keys.duplicated().any():
+        return pd.Index(new_keys.dropna().unique()), pd.Index(old_keys.dropna().unique()), pd.Index([]), True
+    old_i, new_i = old.set_index('Confirmation'), new.set_index('Confirmation')
+    added = new_i.index.difference(old_i.index)
+    removed = old_i.index.difference(new_i.index)
+    common = new_i.index.intersection(old_i.index)
+    columns = [c for c in old_i.columns if c in new_i.columns]
+    before = old_i.loc[common, columns].astype(object).fillna('\0').to_numpy()
+    after = new_i.loc[common, columns].astype(object).fillna('\0').to_numpy()
+    changed = common[(before != after).any(axis=1)]
+    return added, removed, changed, False
+
+def read_appended(path, export):
+    # New rows of an export that only grew since the last read (same bytes up to the old size, ending in
+    # a newline), parsed from the appended bytes alone; None when the file was rewritten in any other way
+    with open(path, 'rb') as f:
+        data = f.read()
+    old_size = export['size']
+    if len(data) <= old_size or data[old_size - 1:old_size] != b'\n':
+        return None
+    if hashlib.sha256(data[:old_size]).hexdigest() != export['sha256']:
+        return None
+    tail = pd.read_csv(io.BytesIO(data[old_size:]), header=None, names=export['header'],
+                       usecols=lambda c: c in INGEST_DTYPES, dtype=INGEST_DTYPES)
+    if tail['Confirmation'].isna().any() or tail['Confirmation'].isin(export['bookings']['Confirmation']).any():
+        return None
+    return tail, len(data), hashlib.sha256(data).hexdigest()
+
+def repatroned_seat_ids(day_aggs, old, new):
+    # Seats held by a booking whose patron differs between two resolve_patrons results
+    both = pd.concat([old.rename('old'), new.rename('new')], axis=1)
+    bookings = both.index[both['old'].ne(both['new'])]
+    ids = [agg['pairs'].loc[agg['pairs']['confirmation'].isin(bookings), 'seat_id'].to_numpy()
+           for agg in day_aggs.values()]
+    return np.concatenate(ids) if ids else np.array([], dtype=np.int64)
+
+def apply_source_change(state, key):
+    # Reads one export again and passes the difference through as deltas: only bookings that were added,
+    # changed or removed are exploded, and only the seats they touch are re-aggregated and recombined.
+    # Patrons are re-resolved only for the bookings linked to the changed ones (see patron_cluster); seats
+    # whose holders changed patron are recombined too.
+    event, registry = state['event'], state['registry']
+    path = event['sources'][key]['path']
+    export = state['exports'][key]
+    old = export['bookings']
+    appended = read_appended(path, export)
+    if appended is not None:
+        tail, size, sha = appended
+        new = pd.concat([old, tail], ignore_index=True)
+        added, removed, changed, rekeyed = pd.Index(tail['Confirmation']), pd.Index([]), pd.Index([]), False
+        export = dict(export, signature=file_signature(path), size=size, sha256=sha, bookings=new)
+    else:
+        export = read_export_state(path)
+        new = export['bookings']
+        added, removed, changed, rekeyed = diff_bookings(old, new)
+    gone = removed.union(changed)
+    fresh = added.union(changed)
+    if rekeyed:
+        old_bookings, new_bookings = tag_bookings(event, key, old), tag_bookings(event, key, new)
+    else:
+        old_bookings = tag_bookings(event, key, old[old['Confirmation'].isin(gone)])
+        new_bookings = tag_bookings(event, key, new[new['Confirmation'].isin(fresh)])
+    old_rows, new_rows = explode_seats(old_bookings), explode_seats(new_bookings)
+    # Revenue sums are additive: take the old bookings' cells out and put the new ones in
+    revenue = merge_cubes([state['revenue'], revenue_cube(event, key, old_bookings, registry),
+                           revenue_cube(event, key, new_bookings, registry)], [1, -1, 1])
+
+    day_seats = dict(state['day_seats'])
+    day_aggs = dict(state['day_aggs'])
+    touched = []
+    for day in event['sources'][key]['days']:
+        seats = day_seats[day]
+        drop = seats['source'] == key
+        if not rekeyed:
+            drop &= seats['confirmation'].isin(gone)
+        day_new = new_rows[new_rows['date'] == day]
+        day_seats[day] = pd.concat([seats[~drop], day_new], ignore_index=True)
+        labels = pd.concat([old_rows.loc[old_rows['date'] == day, 'seat'], day_new['seat']])
+        ids = seat_ids(registry, labels[labels != ''].drop_duplicates())
+        ids = ids[ids >= 0]
+        day_aggs[day] = patch_day_aggregate(event, day_aggs[day], day_seats[day], day, registry, ids)
+        touched.append(ids)
+    exports = {**state['exports'], key: export}
+    bookings, links = dict(state['bookings']), dict(state['patron_links'])
+    new_links = patron_links(new_bookings)
+    if rekeyed:
+        bookings[key], links[key] = new_bookings, new_links
+    else:
+        keep = ~bookings[key]['Confirmation'].isin(gone).to_numpy()
+        bookings[key] = pd.concat([bookings[key][keep], new_bookings], ignore_index=True)
+        links[key] = pd.concat([links[key][keep], new_links], ignore_index=True)
+    cluster = patron_cluster(pd.concat(links.values(), ignore_index=True),
+                             pd.concat([patron_links(old_bookings), new_links], ignore_index=True))
+    bounds = np.cumsum([0] + [len(links[k]) for k in event['sources']])
+    resolved = resolve_patrons(pd.concat([bookings[k][cluster[bounds[i]:bounds[i + 1]]]
+                                          for i, k in enumerate(event['sources'])], ignore_index=True))
+    stale = state['patrons'].index.isin(gone) | state['patrons'].index.isin(resolved.index)
+    patrons = pd.concat([state['patrons'][~stale], resolved])
+    touched.append(repatroned_seat_ids(day_aggs, state['patrons'], patrons))
+    ids = np.unique(np.concatenate(touched))
+    table = update_seat_table(event, state['table'], day_aggs, registry, ids, patrons)
+    change = {
+        'source': key,
+        'file': os.path.basename(path),
+        'appended': appended is not None,
+        'added': len(added),
+        'changed': len(changed),
+        'removed': len(removed),
+        'seats': registry['layout']['seat'].to_numpy()[ids].tolist(),
+        'time': time.time(),
+    }
+    with state['lock']:
+        state['exports'] = exports
+        state['bookings'] = bookings
+        state['patron_links'] = links
+        state['day_seats'] = day_seats
+        state['day_aggs'] = day_aggs
+        state['patrons'] = patrons
+        state['revenue'] = revenue
+        state['table'] = table
+        state['version'] += 1
+        change['version'] = state['version']
+        state['changes'] = (state['changes'] + [change])[-50:]
+    return change
+
+def poll(state):
+    # One check of the event's files. A changed manifest or venue map rebuilds everything; a changed
+    # export is applied as a delta. Files that were only touched (same content) are skipped.
+    event = state['event']
+    if any(file_signature(path) != signature for path, signature in state['venue'].items()):
+        fresh = build_live_state(event['dir'])
+        with state['lock']:
+            version = state['version'] + 1
+            fresh.pop('lock')
+            change = {'rebuilt': True, 'version': version, 'time': time.time()}
+            state.update(fresh, version=version, changes=(state['changes'] + [change])[-50:])
+        return [change]
+    changes = []
+    for key, source in event['sources'].items():
+        export = state['exports'][key]
+        signature = file_signature(source['path'])
+        if signature == export['signature']:
+            continue
+        with open(source['path'], 'rb') as f:
+            same = hashlib.sha256(f.read()).hexdigest() == export['sha256']
+        if same:
+            with state['lock']:
+                state['exports'] = {**state['exports'], key: dict(export, signature=signature)}
+            continue
+        changes.append(apply_source_change(state, key))
+    return changes
+
+def watch(state, interval=WATCH_INTERVAL, on_change=None, stop=None):
+    # Polls until stop (a threading.Event) is set; errors are kept on the state and retried next time,
+    # so a half-written export does not kill the watcher
+    while stop is None or not stop.is_set():
+        try:
+            changes = poll(state)
+            state['error'] = None
+        except Exception as exc:  # noqa: BLE001 - surfaced to the viewer instead
+            changes = []
+            state['error'] = f'{type(exc).__name__}: {exc}'
+        if on_change:
+            for change in changes:
+                on_change(change)
+        if stop is None:
+            time.sleep(interval)
+        elif stop.wait(interval):
+            break
+
+def start_watcher(event_dir, interval=WATCH_INTERVAL):
+    # Live state for an event plus a daemon thread keeping it current
+    state = build_live_state(event_dir)
+    state['stop'] = threading.Event()
+    threading.Thread(target=watch, args=(state, interval, None, state['stop']), daemon=True,
+                     name=f'watch:{event_dir}').start()
+    return state
+
+def describe_change(change):
+    if change.get('rebuilt'):
+        return f"v{change['version']}: manifest or venue map changed, rebuilt"
+    kind = 'appended' if change['appended'] else 'rewritten'
+    return (f"v{change['version']}: {change['file']} {kind}: +{change['added']} ~{change['changed']} "
+            f"-{change['removed']} bookings, {len(change['seats'])} seat(s) recomputed")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Watch an event's exports and apply changes incrementally.")
+    parser.add_argument('event_dir', nargs='?', default='data')
+    parser.add_argument('--interval', type=float, default=WATCH_INTERVAL, help='seconds between checks')
+    args = parser.parse_args(argv)
+    state = build_live_state(args.event_dir)
+    print(f"Watching {state['event']['name']} ({len(state['event']['sources'])} exports); Ctrl+C to stop")
+    try:
+        watch(state, args.interval, on_change=lambda change: print(describe_change(change), flush=True))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    main()